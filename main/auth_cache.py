@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import jwt
+
+# --- Verified-session cache ---
+# A browser that comes back with a valid login cookie (reload, new tab, a second
+# session) would otherwise go through the authenticator's token decode, a write to the
+# user row and its fixed pre-login sleep. Verified tokens are remembered here for TTL
+# seconds, so only the first session per token pays for that. bcrypt checks and hashes
+# run on a small bounded pool: a burst of logins waits its turn instead of pinning
+# every script thread's CPU.
+
+TTL = float(os.environ.get('AUTH_CACHE_TTL', 15 * 60))
+HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', 2))
+MAX_ENTRIES = 10_000
+
+_lock = threading.Lock()
+_verified = {}  # token -> (username, expires_at)
+_hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='auth-hash')
+stats = {'reruns': 0, 'seconds': 0.0, 'resumed': 0, 'decoded': 0, 'rejected': 0, 'hash_jobs': 0}
+
+
+def verify(token, cookie_key):
+    """Username for a valid, unexpired login cookie (decoded at most once per TTL), else None."""
+    if not token:
+        return None
+    now = time.time()
+    with _lock:
+        entry = _verified.get(token)
+        if entry is not None and entry[1] > now:
+            stats['resumed'] += 1
+            return entry[0]
+    try:
+        payload = jwt.decode(token, cookie_key, algorithms=['HS256'])
+    except jwt.PyJWTError:
+        payload = None
+    if not payload or 'username' not in payload or payload.get('exp_date', 0) <= now:
+        with _lock:
+            stats['rejected'] += 1
+        return None
+    with _lock:
+        if len(_verified) >= MAX_ENTRIES:
+            _verified.clear()
+        _verified[token] = (payload['username'], min(now + TTL, payload['exp_date']))
+        stats['decoded'] += 1
+    return payload['username']
+
+
+def forget(token):
+    with _lock:
+        _verified.pop(token, None)
+
+
+def forget_user(username):
+    with _lock:
+        for token in [t for t, (u, _) in _verified.items() if u == username]:
+            del _verified[token]
+
+
+def run_hashing(fn, *args, **kwargs):
+    """Run a bcrypt-bound call on the shared pool and wait for it."""
+    with _lock:
+        stats['hash_jobs'] += 1
+    return _hash_pool.submit(fn, *args, **kwargs).result()
+
+
+def record_rerun(seconds):
+    with _lock:
+        stats['reruns'] += 1
+        stats['seconds'] += seconds
+
+
+def mean_rerun_ms():
+    return 1000 * stats['seconds'] / stats['reruns'] if stats['reruns'] else 0.0
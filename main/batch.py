@@ -0,0 +1,108 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import preprocess
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # PDF pages need pypdfium2; plain images work without it
+    pdfium = None
+
+# --- Batch solving for Upload mode ---
+# A worksheet arrives as several photos or a PDF. Every page becomes one image and the
+# pages are solved concurrently on a small pool (the shared rate limiter still paces
+# the actual Gemini calls); results come back as they finish and the page shows them
+# in page order.
+
+WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+MAX_PAGES = 40
+PDF_DPI = 150
+
+
+def _render_pdf_page(page):
+    # no more pixels than the model copy of a photo gets
+    width, height = page.get_size()
+    scale = min(PDF_DPI / 72, preprocess.UPLOAD_LONG_EDGE / max(width, height))
+    return page.render(scale=scale).to_pil().convert('RGB')
+
+
+def load_pages(files):
+    """([(label, model-sized image, thumbnail JPEG bytes)], [error]) in upload / page order."""
+    pages, errors = [], []
+    for f in files:
+        if len(pages) >= MAX_PAGES:
+            errors.append(f"Only the first {MAX_PAGES} pages are solved.")
+            break
+        if f.name.lower().endswith('.pdf'):
+            if pdfium is None:
+                errors.append(f"{f.name}: PDF support needs the pypdfium2 package.")
+                continue
+            try:
+                pdf = pdfium.PdfDocument(f.getvalue())
+                for i in range(min(len(pdf), MAX_PAGES - len(pages))):
+                    image = _render_pdf_page(pdf[i])
+                    pages.append((f"{f.name} · page {i + 1}", image, preprocess.thumbnail_jpeg(image)))
+            except Exception as e:
+                errors.append(f"{f.name}: {e}")
+        else:
+            try:
+                image = preprocess.decode_upload(f.getvalue())
+                pages.append((f.name, image, preprocess.thumbnail_jpeg(image)))
+            except Exception as e:
+                errors.append(f"{f.name}: {e}")
+    return pages, errors
+
+
+def solve_pages(images, solve, workers=WORKERS):
+    """Yield (index, text) as each page finishes; solve(image) must not touch st.*."""
+    def job(i, image):
+        return i, solve(image)
+
+    # as in classifier.classify_many: an interrupted batch must not wait for the pages still queued
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-solve')
+    try:
+        futures = [pool.submit(job, i, image) for i, image in enumerate(images)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def combined(labels, results):
+    return '\n\n---\n\n'.join(f"### {label}\n\n{text}" for label, text in zip(labels, results) if text is not None)
+
+
+# --- Benchmark: GOOGLE_API_KEY=... python main/batch.py worksheet.pdf [more files...] ---
+class _File:
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            self.data = f.read()
+
+    def getvalue(self):
+        return self.data
+
+
+if __name__ == '__main__':
+    import sys
+    import gemini
+
+    pages, errors = load_pages([_File(p) for p in sys.argv[1:]])
+    for error in errors:
+        print(error)
+    model = gemini.get_model(os.environ['GOOGLE_API_KEY'])
+    images = [image for _, image, _ in pages]
+    # each run uses its own prompt so neither can be served from the other's in-flight calls
+    solve = lambda tag: lambda image: gemini.generate(model, [f"({tag}) Solve step-by-step:", image], mode='upload').text
+
+    start = time.perf_counter()
+    for image in images:
+        solve('sequential')(image)
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in solve_pages(images, solve('concurrent')):
+        pass
+    concurrent = time.perf_counter() - start
+    print(f"{len(images)} pages: sequential {sequential:.1f}s, {WORKERS} workers {concurrent:.1f}s "
+          f"({sequential / concurrent:.1f}x)")
@@ -0,0 +1,82 @@
+import logging
+
+import gemini
+import ratelimit
+
+# --- Bounded chat context ---
+# The persona is sent once as the model's system instruction, the last KEEP_MESSAGES
+# messages are sent verbatim, and everything older is folded into a running summary
+# that is refreshed every FOLD_EVERY folded messages. Input tokens per turn therefore
+# stay flat however long the tutoring session gets.
+
+PERSONA = ("You are a helpful math tutor developed by O(1) Squad. "
+           "The members are Dev Soni(Leader), Sunny Yadav, Rishi Bisht.")
+KEEP_MESSAGES = 6
+FOLD_EVERY = 4
+MAX_HISTORY_TOKENS = 6000
+MAX_SUMMARY_CHARS = 2000
+
+log = logging.getLogger(__name__)
+
+
+def count_tokens(text):
+    return ratelimit.estimate_tokens(text)
+
+
+class ChatContext:
+    def __init__(self):
+        self.summary = ''
+        self.recent = []  # [(role, text)] sent verbatim, oldest first
+        self.folding = []  # aged out of `recent`, waiting for the next summary refresh
+        self.last_input_tokens = 0
+        self.summarized = 0
+
+    def add(self, role, text):
+        self.recent.append(('model' if role == 'assistant' else role, text))
+        while len(self.recent) > KEEP_MESSAGES or (len(self.recent) > 2 and self._tokens(self.recent) > MAX_HISTORY_TOKENS):
+            self.folding.append(self.recent.pop(0))
+
+    def _tokens(self, messages):
+        return sum(count_tokens(text) for _, text in messages)
+
+    def history(self):
+        """Contents for start_chat(history=...): summary, not-yet-summarized turns, recent turns."""
+        contents = []
+        if self.summary:
+            contents.append({'role': 'user', 'parts': [f"Summary of our conversation so far:\n{self.summary}"]})
+            contents.append({'role': 'model', 'parts': ["Got it, I'll keep that in mind."]})
+        for role, text in self.folding + self.recent:
+            if contents and contents[-1]['role'] == role:
+                contents[-1]['parts'].append(text)  # e.g. a solution pushed in from Draw mode
+            else:
+                contents.append({'role': role, 'parts': [text]})
+        # the API expects turns to alternate starting with the user
+        if contents and contents[0]['role'] != 'user':
+            contents.insert(0, {'role': 'user', 'parts': ["(continuing our conversation)"]})
+        return contents
+
+    def prepare(self, chat, message):
+        """Point an existing ChatSession at the bounded history before sending `message`."""
+        chat.history = self.history()
+        self.last_input_tokens = (count_tokens(PERSONA) + count_tokens(message)
+                                  + sum(count_tokens(c['parts']) for c in self.history()))
+        return chat
+
+    def needs_refresh(self):
+        return len(self.folding) >= FOLD_EVERY
+
+    def refresh_summary(self, api_key):
+        """Fold aged-out turns into the summary; on failure keep them verbatim and try again next turn."""
+        if not self.folding:
+            return
+        transcript = '\n'.join(f"{'Student' if role == 'user' else 'Tutor'}: {text}" for role, text in self.folding)
+        prompt = (f"Update this summary of a math tutoring conversation with the new exchanges. Keep the problems, "
+                  f"results and what the student struggled with; stay under {MAX_SUMMARY_CHARS // 5} words.\n\n"
+                  f"Current summary:\n{self.summary or '(none)'}\n\nNew exchanges:\n{transcript}")
+        try:
+            response = gemini.generate(gemini.get_model(api_key), prompt, mode='chat')
+            self.summary = response.text.strip()[:MAX_SUMMARY_CHARS]
+            self.summarized += len(self.folding)
+            self.folding = []
+        except Exception as e:
+            log.warning("chat summary refresh failed: %s", e)
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import difficulty_model
+import gemini
+import jsonstream
+import mathengine
+import ratelimit
+
+# --- Problem difficulty classifier ---
+# Prompt, response schema and parsing shared by the Classifier page, plus the bulk
+# mode that classifies a whole uploaded worksheet over a bounded thread pool.
+
+CATEGORIES = ["Easy", "Medium", "Hard", "Advanced"]
+MAX_ROWS = 1000
+PROBLEM_COLUMNS = ('problem', 'problem_text', 'question', 'text')
+BULK_QUEUE_SECONDS = 600  # per call; a worksheet waits its turn behind interactive users
+
+RESULT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "difficulty": {"type": "STRING", "enum": CATEGORIES},
+        "required_concepts": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["difficulty", "required_concepts"],
+}
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": RESULT_SCHEMA}
+
+
+def classifier_prompt(problem_text):
+    return f"""
+    Analyze the following math problem. Classify its difficulty into one of four categories: Easy, Medium, Hard, or Advanced.
+    Also, list the key mathematical concepts required to solve it.
+
+    Problem: '{problem_text}'
+
+    Return a single, valid JSON object with two keys: "difficulty" (a string from the categories) and "required_concepts" (a list of strings).
+    Do not include any text, explanation, or markdown formatting before or after the JSON object.
+    """
+
+
+def normalize(result):
+    """Coerce a parsed (possibly partial) result into {difficulty, required_concepts}."""
+    if not isinstance(result, dict):
+        return None
+    difficulty = str(result.get('difficulty') or '').strip()
+    for category in CATEGORIES:
+        if difficulty.lower() == category.lower():
+            difficulty = category
+            break
+    concepts = result.get('required_concepts') or []
+    if isinstance(concepts, str):
+        concepts = [c.strip() for c in concepts.split(',') if c.strip()]
+    return {'difficulty': difficulty or "N/A", 'required_concepts': [str(c) for c in concepts]}
+
+
+def parse_result(text):
+    """Raises json.JSONDecodeError when the text can't be repaired."""
+    result = normalize(jsonstream.loads(text))
+    if result is None:
+        raise json.JSONDecodeError("expected a JSON object", text, 0)
+    return result
+
+
+def classify(problem_text, api_key, model=None):
+    """(result, source): the local engine, then the distilled model, then Gemini (whose label is logged)."""
+    local = mathengine.classify(problem_text)
+    if local is not None:
+        return local, 'local'
+    distilled = difficulty_model.predict(problem_text)
+    if distilled is not None:
+        return distilled, 'distilled'
+    model = model or gemini.get_model(api_key, generation_config=GENERATION_CONFIG)
+    result = parse_result(gemini.generate(model, classifier_prompt(problem_text), mode='classifier').text)
+    difficulty_model.log_label(problem_text, result)
+    return result, 'gemini'
+
+
+# --- Bulk mode ---
+def _pick(record):
+    if isinstance(record, str):
+        return record
+    if isinstance(record, dict):
+        lowered = {str(k).strip().lower(): v for k, v in record.items()}
+        for column in PROBLEM_COLUMNS:
+            if lowered.get(column):
+                return str(lowered[column])
+        values = [v for v in record.values() if v]
+        return str(values[0]) if values else ''
+    return ''
+
+
+def read_problems(filename, data):
+    """(problems, skipped lines) from an uploaded CSV (a problem/question/text column, else the first one) or JSONL file."""
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = data.decode('cp1252', errors='replace')  # e.g. an Excel CSV export
+    skipped = 0
+    if filename.lower().endswith(('.jsonl', '.ndjson')):
+        records = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                skipped += 1
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if reader.fieldnames and not any(f.strip().lower() in PROBLEM_COLUMNS for f in reader.fieldnames):
+            # no header we recognise: treat every row's first cell as a problem
+            records = [row[0] for row in csv.reader(io.StringIO(text)) if row]
+        else:
+            records = list(reader)
+    problems = [_pick(r).strip() for r in records]
+    return [p for p in problems if p][:MAX_ROWS], skipped
+
+
+def max_workers():
+    # more workers than this would only sit in the shared limiter's queue ahead of interactive users
+    return max(1, min(16, ratelimit.RPM // 2))
+
+
+def classify_many(problems, api_key, workers=4):
+    """Yield (index, result, source, error) as each problem finishes, in completion order.
+
+    Gemini calls are paced by the shared limiter (ratelimit.RPM); they may queue for up to
+    BULK_QUEUE_SECONDS each instead of failing as 'quota exhausted' rows.
+    """
+    model = gemini.get_model(api_key, generation_config=GENERATION_CONFIG)
+    workers = min(workers, max_workers())
+
+    def job(i, problem_text):
+        local = mathengine.classify(problem_text)
+        if local is not None:
+            return i, local, 'local', None
+        distilled = difficulty_model.predict(problem_text)
+        if distilled is not None:
+            return i, distilled, 'distilled', None
+        try:
+            result = parse_result(gemini.generate(model, classifier_prompt(problem_text), mode='classifier',
+                                                  queue_timeout=BULK_QUEUE_SECONDS).text)
+            difficulty_model.log_label(problem_text, result)
+            return i, result, 'gemini', None
+        except Exception as e:
+            return i, None, 'error', str(e)
+
+    # not a with-block: a rerun closes this generator mid-way, and shutdown(wait=True) would then hold the
+    # script thread until every queued row had run; queued rows are dropped instead
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-classify')
+    try:
+        futures = [pool.submit(job, i, p) for i, p in enumerate(problems)]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def results_csv(rows):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=['row', 'problem', 'difficulty', 'required_concepts', 'source'])
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
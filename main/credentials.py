@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections.abc import MutableMapping
+
+import yaml
+from yaml.loader import SafeLoader
+
+# --- Credential backends for fun.py ---
+# The authenticator only needs a mapping of username -> user dict. YamlBackend is the
+# original behaviour (the whole config.yaml rewritten after each registration);
+# SqliteBackend serves the same mapping from an indexed SQLite table in WAL mode, so a
+# lookup or a registration touches one row and concurrent sign-ups from several
+# processes can't clobber each other. Pick one with CREDENTIALS_BACKEND=sqlite|yaml.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(HERE, 'config.yaml')
+DB_PATH = os.environ.get('CREDENTIALS_DB', os.path.join(HERE, '.users.db'))
+BACKEND = os.environ.get('CREDENTIALS_BACKEND', 'sqlite')
+
+COLUMNS = ('email', 'first_name', 'last_name', 'password', 'roles', 'logged_in', 'failed_login_attempts',
+           'password_hint')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    email TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    password TEXT,
+    roles TEXT,
+    logged_in INTEGER DEFAULT 0,
+    failed_login_attempts INTEGER DEFAULT 0,
+    password_hint TEXT
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def load_config(path=CONFIG_PATH):
+    with open(path) as file:
+        return yaml.load(file, Loader=SafeLoader)
+
+
+class YamlBackend:
+    def __init__(self, config, path=CONFIG_PATH):
+        self.config, self.path = config, path
+        self.users = config['credentials']['usernames']
+
+    def contains_value(self, value):
+        return any(value in d.values() for d in self.users.values())
+
+    def after_register(self, username):
+        with open(self.path, 'w') as file:
+            yaml.dump(self.config, file, default_flow_style=False)
+
+
+# --- SQLite ---
+def _encode(column, value):
+    if column == 'roles':
+        return None if value is None else json.dumps(value)
+    if column == 'logged_in':
+        return int(bool(value))
+    return value
+
+
+def _decode(row):
+    user = {column: row[column] for column in COLUMNS if row[column] is not None}
+    user['roles'] = json.loads(row['roles']) if row['roles'] else None
+    user['logged_in'] = bool(row['logged_in'])
+    return user
+
+
+class UserRecord(dict):
+    """One user's fields; assignments (logged_in, failed_login_attempts, ...) are written straight through."""
+
+    def __init__(self, backend, username, fields):
+        super().__init__(fields)
+        self.backend, self.username = backend, username
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if key in COLUMNS:
+            self.backend.execute(f"UPDATE users SET {key} = ? WHERE username = ?", (_encode(key, value), self.username))
+
+
+class UserTable(MutableMapping):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getitem__(self, username):
+        row = self.backend.query("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            raise KeyError(username)
+        return UserRecord(self.backend, username, _decode(row))
+
+    def __contains__(self, username):
+        return self.backend.query("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone() is not None
+
+    def __setitem__(self, username, user):
+        # registration: a single-row insert; losing a race for the same username fails here
+        values = [_encode(column, user.get(column)) for column in COLUMNS]
+        try:
+            self.backend.execute(f"INSERT INTO users (username, {', '.join(COLUMNS)}) "
+                                 f"VALUES (?{', ?' * len(COLUMNS)})", [username] + values)
+        except sqlite3.IntegrityError:
+            raise ValueError('Username/email already taken')
+
+    def __delitem__(self, username):
+        self.backend.execute("DELETE FROM users WHERE username = ?", (username,))
+
+    def __iter__(self):
+        for row in self.backend.query("SELECT username FROM users"):
+            yield row['username']
+
+    def __len__(self):
+        return self.backend.query("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+class SqliteBackend:
+    def __init__(self, config, path=DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.conn().executescript(SCHEMA)
+        self.migrate(config)
+        self.users = UserTable(self)
+
+    def conn(self):
+        # sqlite3 connections can't be shared across threads; Streamlit runs each session in its own
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def query(self, sql, params=()):
+        return self.conn().execute(sql, params)
+
+    def execute(self, sql, params=()):
+        self.conn().execute(sql, params)
+
+    def migrate(self, config):
+        """One-shot import of the users in config.yaml; later runs leave the table alone."""
+        conn = self.conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'yaml_migrated'").fetchone() is None:
+                users = (config.get('credentials') or {}).get('usernames') or {}
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO users (username, {', '.join(COLUMNS)}) VALUES (?{', ?' * len(COLUMNS)})",
+                    [[username.lower()] + [_encode(c, user.get(c)) for c in COLUMNS] for username, user in users.items()])
+                conn.execute("INSERT INTO meta (key, value) VALUES ('yaml_migrated', ?)", (str(len(users)),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def contains_value(self, value):
+        # the authenticator only asks this to check that an e-mail is free
+        return self.query("SELECT 1 FROM users WHERE email = ? LIMIT 1", (value,)).fetchone() is not None
+
+    def after_register(self, username):
+        pass  # the insert was already committed
+
+
+def open_backend(config, name=BACKEND):
+    if name == 'yaml':
+        return YamlBackend(config)
+    return SqliteBackend(config)
+
+
+# --- Benchmark: python main/credentials.py [users] ---
+# bcrypt costs the same with either backend, so only the store is timed
+def _bench(users):
+    import tempfile
+
+    password = '$2b$12$' + 'x' * 53
+    config = {'cookie': {}, 'credentials': {'usernames': {
+        f"user{i}": {'email': f"user{i}@example.com", 'first_name': 'user', 'last_name': str(i), 'password': password}
+        for i in range(users)}}}
+    with tempfile.TemporaryDirectory() as tmp:
+        yaml_path = os.path.join(tmp, 'config.yaml')
+        with open(yaml_path, 'w') as file:
+            yaml.dump(config, file, default_flow_style=False)
+
+        start = time.perf_counter()
+        yaml_backend = YamlBackend(load_config(yaml_path), yaml_path)
+        print(f"yaml load of {users} users: {time.perf_counter() - start:.2f} s")
+        start = time.perf_counter()
+        sqlite_backend = SqliteBackend(load_config(yaml_path), os.path.join(tmp, 'users.db'))
+        print(f"one-shot sqlite migration (including the yaml load): {time.perf_counter() - start:.2f} s")
+
+        for label, backend in (('yaml', yaml_backend), ('sqlite', sqlite_backend)):
+            start = time.perf_counter()
+            for i in range(1000):
+                username = f"user{(i * 7919) % users}"
+                if username in backend.users:
+                    backend.users[username]['password']
+                    backend.users[username]['failed_login_attempts'] = 0
+            login_ms = (time.perf_counter() - start) * 1000 / 1000
+            start = time.perf_counter()
+            for i in range(3):
+                username = f"new{i}"
+                if not backend.contains_value(f"{username}@example.com") and username not in backend.users:
+                    backend.users[username] = {'email': f"{username}@example.com", 'password': password}
+                    backend.after_register(username)
+            register_ms = (time.perf_counter() - start) * 1000 / 3
+            print(f"{label:>7}: login lookup {login_ms:8.3f} ms   register {register_ms:9.2f} ms")
+
+
+if __name__ == '__main__':
+    _bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+import zlib
+
+import numpy as np
+
+# --- Distilled local difficulty classifier ---
+# Every Gemini classification is appended to a JSONL log. A linear model over hashed
+# word / character n-grams is trained on that log (python main/difficulty_model.py
+# train) and answers locally when it is confident; otherwise the page escalates to
+# Gemini as before.
+
+CATEGORIES = ["Easy", "Medium", "Hard", "Advanced"]
+DIM = 2 ** 16
+MIN_CONFIDENCE = 0.90
+MIN_EXAMPLES = 50
+MIN_CONCEPT_COUNT = 3
+MAX_CONCEPTS = 64
+HERE = os.path.dirname(os.path.abspath(__file__))
+LOG_PATH = os.path.join(HERE, '.classifier_log.jsonl')
+MODEL_PATH = os.path.join(HERE, '.classifier_model.npz')
+
+log = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[a-z0-9]+|[^\sa-z0-9]")
+_lock = threading.Lock()
+_model = None
+_model_mtime = None
+stats = {'local': 0, 'escalated': 0, 'local_seconds': 0.0}
+
+
+# --- Label log ---
+def log_label(problem_text, result):
+    record = {'problem_text': problem_text, 'difficulty': result.get('difficulty'),
+              'required_concepts': result.get('required_concepts', []), 'ts': time.time()}
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    with _lock:
+        try:
+            with open(LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError:
+            pass
+
+
+def read_log(path=LOG_PATH):
+    # latest label wins when the same problem was classified more than once
+    examples = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('difficulty') in CATEGORIES and record.get('problem_text'):
+                    examples[' '.join(record['problem_text'].lower().split())] = record
+    except OSError:
+        pass
+    return list(examples.values())
+
+
+# --- Features: hashed word 1-2 grams + character 3-5 grams, l2-normalized ---
+def featurize(text):
+    text = ' '.join(text.lower().split())
+    words = _WORD.findall(text)
+    grams = [f"w:{w}" for w in words] + [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    padded = f" {text} "
+    for n in (3, 4, 5):
+        grams += [f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1)]
+    if not grams:
+        return np.zeros(0, np.int64), np.zeros(0, np.float32)
+    idx = np.fromiter((zlib.crc32(g.encode('utf-8')) % DIM for g in grams), dtype=np.int64, count=len(grams))
+    idx, counts = np.unique(idx, return_counts=True)
+    values = counts.astype(np.float32)
+    return idx, values / np.linalg.norm(values)
+
+
+def _batch(texts):
+    feats = [featurize(t) for t in texts]
+    indptr = np.cumsum([0] + [len(i) for i, _ in feats])
+    return np.concatenate([i for i, _ in feats]), np.concatenate([v for _, v in feats]), indptr
+
+
+def _scores(W, b, idx, val, indptr):
+    contrib = W[idx] * val[:, None]
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    out = np.zeros((len(indptr) - 1, W.shape[1]), np.float32)
+    np.add.at(out, rows, contrib)
+    return out + b
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+def _fit(idx, val, indptr, targets, multiclass, epochs=150, lr=4.0, l2=1e-5):
+    n, k = targets.shape
+    W = np.zeros((DIM, k), np.float32)
+    b = np.zeros(k, np.float32)
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    for _ in range(epochs):
+        z = _scores(W, b, idx, val, indptr)
+        p = _softmax(z) if multiclass else _sigmoid(z)
+        g = (p - targets) / n
+        gradW = np.zeros_like(W)
+        np.add.at(gradW, idx, g[rows] * val[:, None])
+        W -= lr * (gradW + l2 * W)
+        b -= lr * g.sum(axis=0)
+    return W, b
+
+
+def train(examples):
+    texts = [e['problem_text'] for e in examples]
+    idx, val, indptr = _batch(texts)
+    y = np.array([CATEGORIES.index(e['difficulty']) for e in examples])
+    W_diff, b_diff = _fit(idx, val, indptr, np.eye(len(CATEGORIES), dtype=np.float32)[y], multiclass=True)
+
+    counts = {}
+    for e in examples:
+        for c in set(e.get('required_concepts') or []):
+            counts[c] = counts.get(c, 0) + 1
+    concepts = [c for c, n in sorted(counts.items(), key=lambda kv: -kv[1]) if n >= MIN_CONCEPT_COUNT][:MAX_CONCEPTS]
+    if concepts:
+        targets = np.array([[c in (e.get('required_concepts') or []) for c in concepts] for e in examples], np.float32)
+        W_con, b_con = _fit(idx, val, indptr, targets, multiclass=False)
+    else:
+        W_con, b_con = np.zeros((DIM, 0), np.float32), np.zeros(0, np.float32)
+    return {'W_diff': W_diff, 'b_diff': b_diff, 'W_con': W_con, 'b_con': b_con, 'concepts': np.array(concepts, dtype=str)}
+
+
+def _predict(model, text):
+    idx, val = featurize(text)
+    if idx.size == 0:
+        return None, 0.0
+    p = _softmax(((model['W_diff'][idx] * val[:, None]).sum(axis=0) + model['b_diff'])[None, :])[0]
+    best = int(p.argmax())
+    concepts = []
+    if model['W_con'].shape[1]:
+        q = _sigmoid((model['W_con'][idx] * val[:, None]).sum(axis=0) + model['b_con'])
+        order = np.argsort(-q)
+        concepts = [str(model['concepts'][i]) for i in order if q[i] >= 0.5] or [str(model['concepts'][order[0]])]
+    return {'difficulty': CATEGORIES[best], 'required_concepts': concepts}, float(p[best])
+
+
+def load_model():
+    """The trained model, reloaded when the file on disk changes; None if nothing has been trained yet."""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        return None
+    if mtime != _model_mtime:
+        with _lock:
+            if mtime != _model_mtime:
+                try:
+                    with np.load(MODEL_PATH) as data:
+                        _model = {k: data[k] for k in data.files}
+                except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+                    # keep serving the previous model; a fixed file gets a new mtime and is picked up then
+                    log.warning("could not load %s: %s", MODEL_PATH, e)
+                _model_mtime = mtime
+    return _model
+
+
+def save_model(model, path=MODEL_PATH):
+    """Write to a temp file and rename it into place, so running apps never read a half-written zip."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **model)
+    os.replace(tmp, path)
+
+
+def predict(problem_text, min_confidence=MIN_CONFIDENCE):
+    """{difficulty, required_concepts} when the local model is confident, else None (escalate to Gemini)."""
+    start = time.perf_counter()
+    model = load_model()
+    result, confidence = _predict(model, problem_text) if model is not None else (None, 0.0)
+    with _lock:
+        if result is None or confidence < min_confidence:
+            stats['escalated'] += 1
+            return None
+        stats['local'] += 1
+        stats['local_seconds'] += time.perf_counter() - start
+    return result
+
+
+# --- Retraining: python main/difficulty_model.py [train|report] ---
+def report(examples, holdout=0.2, seed=0):
+    """Agreement with Gemini labels on a held-out split."""
+    order = np.random.default_rng(seed).permutation(len(examples))
+    cut = int(len(examples) * (1 - holdout))
+    train_set, test_set = [examples[i] for i in order[:cut]], [examples[i] for i in order[cut:]]
+    model = train(train_set)
+    agree = confident = confident_agree = 0
+    timings = []
+    for e in test_set:
+        start = time.perf_counter()
+        result, confidence = _predict(model, e['problem_text'])
+        timings.append(time.perf_counter() - start)
+        hit = result is not None and result['difficulty'] == e['difficulty']
+        agree += hit
+        if confidence >= MIN_CONFIDENCE:
+            confident += 1
+            confident_agree += hit
+    n = max(len(test_set), 1)
+    timings.sort()
+    print(f"held-out examples: {len(test_set)} (trained on {len(train_set)})")
+    print(f"difficulty agreement with Gemini: {agree / n:.1%}")
+    print(f"answered locally at p >= {MIN_CONFIDENCE}: {confident / n:.1%} of problems, "
+          f"{confident_agree / max(confident, 1):.1%} agreement on those")
+    if timings:
+        print(f"inference p50 {1e6 * timings[len(timings) // 2]:.0f} us, p99 {1e6 * timings[int(0.99 * (len(timings) - 1))]:.0f} us")
+
+
+if __name__ == '__main__':
+    examples = read_log()
+    if len(examples) < MIN_EXAMPLES:
+        sys.exit(f"only {len(examples)} labelled problems in {LOG_PATH}; need at least {MIN_EXAMPLES}")
+    report(examples)
+    if len(sys.argv) < 2 or sys.argv[1] == 'train':
+        start = time.perf_counter()
+        model = train(examples)
+        save_model(model)
+        print(f"trained on all {len(examples)} examples in {time.perf_counter() - start:.1f}s -> {MODEL_PATH}")
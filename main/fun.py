@@ -1,21 +1,68 @@
+import os
+import time
+
 import streamlit as st
 import streamlit_authenticator as stauth
-import yaml
-from yaml.loader import SafeLoader
+
+import auth_cache
+import credentials
 
 # --- Load config ---
-with open('main/config.yaml') as file:
-    config = yaml.load(file, Loader=SafeLoader)
+config = credentials.load_config()
+backend = credentials.open_backend(config)
 
 # --- Initialize authenticator ---
+# The authenticator copies whatever user mapping it is constructed with, so the
+# backend's table is attached afterwards and never read in full.
+user_credentials = {'usernames': {}}
 authenticator = stauth.Authenticate(
-    config['credentials'],
+    user_credentials,
     config['cookie']['name'],
     config['cookie']['key'],
     config['cookie']['expiry_days'],
 )
+user_credentials['usernames'] = backend.users
+# the e-mail uniqueness check on registration scans every user; let the backend answer it
+auth_model = authenticator.authentication_controller.authentication_model
+auth_model._credentials_contains_value = backend.contains_value
+# bcrypt checks and hashes go through a bounded pool (see auth_cache)
+_check_credentials, _register_credentials = auth_model.check_credentials, auth_model._register_credentials
+auth_model.check_credentials = lambda *args, **kwargs: auth_cache.run_hashing(_check_credentials, *args, **kwargs)
+auth_model._register_credentials = lambda *args, **kwargs: auth_cache.run_hashing(_register_credentials, *args, **kwargs)
+
+
+def resume_verified_session():
+    # a login cookie verified within the TTL skips the authenticator's decode and pre-login sleep
+    token = st.context.cookies.get(config['cookie']['name'])
+    username = auth_cache.verify(token, config['cookie']['key'])
+    if username is None or username not in backend.users:
+        return False
+    user = backend.users[username]
+    st.session_state['authentication_status'] = True
+    st.session_state['username'] = username
+    st.session_state['name'] = f"{user.get('first_name') or ''} {user.get('last_name') or ''}".strip()
+    st.session_state['email'] = user.get('email')
+    st.session_state['roles'] = user.get('roles')
+    return True
+
+
+# admins see the telemetry dashboard: the 'admin' role, or a username listed in ADMIN_USERS
+ADMIN_USERS = {u.strip() for u in os.environ.get('ADMIN_USERS', '').split(',') if u.strip()}
+
+
+def is_admin():
+    return 'admin' in (st.session_state.get('roles') or []) or st.session_state.get('username') in ADMIN_USERS
+
 
 def login_register_page():
+    start = time.perf_counter()
+    try:
+        show_login_register()
+    finally:
+        auth_cache.record_rerun(time.perf_counter() - start)
+
+
+def show_login_register():
     
 
     # flag for register and login form
@@ -23,6 +70,8 @@ def login_register_page():
         if key not in st.session_state:
             st.session_state[key] = None if key == 'authentication_status' else ""
 
+    if not st.session_state['authentication_status'] and not st.session_state['logout'] and auth_cache.TTL > 0:
+        resume_verified_session()
 
 
     if not st.session_state['authentication_status']:
@@ -53,8 +102,7 @@ def login_register_page():
                     st.write('successfully registered',name)
                     
                     
-                    with open('main/config.yaml','w') as file:
-                        yaml.dump(config,file,default_flow_style=False)
+                    backend.after_register(username)
                     st.session_state['show_register']=False
                     st.rerun()
             except Exception as e:
@@ -63,5 +111,7 @@ def login_register_page():
     else:
         
         with st.sidebar:
-            st.write(f"welcome {config['credentials']['usernames'][st.session_state['username']]['first_name']}")
-            authenticator.logout()
\ No newline at end of file
+            st.write(f"welcome {backend.users[st.session_state['username']]['first_name']}")
+            authenticator.logout()
+            if not st.session_state['authentication_status']:
+                auth_cache.forget(st.context.cookies.get(config['cookie']['name']))
\ No newline at end of file
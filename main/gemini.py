@@ -0,0 +1,163 @@
+import json
+import logging
+import sys
+import threading
+import time
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+import ratelimit
+import singleflight
+import telemetry
+
+DEFAULT_MODEL = 'gemini-2.0-flash-exp'
+
+log = logging.getLogger(__name__)
+
+# --- Process-wide client registry ---
+# Streamlit imports this module once per server process, so everything below is
+# shared by every session and every script thread.
+_lock = threading.Lock()
+_models = {}
+_configured_key = None
+
+
+def _freeze(value):
+    # generation configs are dicts / lists; turn them into something hashable
+    if value is None:
+        return None
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def _configure(api_key):
+    global _configured_key
+    if _configured_key != api_key:
+        genai.configure(api_key=api_key)
+        _configured_key = api_key
+
+
+def get_model(api_key, model_name=DEFAULT_MODEL, generation_config=None, system_instruction=None):
+    key = (model_name, api_key, _freeze(generation_config), system_instruction)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            _configure(api_key)
+            model = genai.GenerativeModel(model_name, generation_config=generation_config,
+                                          system_instruction=system_instruction)
+            # bind the client now so a later configure() for another key can't redirect this model
+            model._client = genai_client.get_default_generative_client()
+            _models[key] = model
+    return model
+
+
+def get_gemini_model(api_key, model_name=DEFAULT_MODEL, generation_config=None, system_instruction=None):
+    try:
+        return get_model(api_key, model_name, generation_config, system_instruction), None
+    except Exception as e:
+        return None, str(e)
+
+
+# --- Calls: everything goes through the shared rate limiter ---
+def request_key(model, contents, **kwargs):
+    # (model, normalized prompt, image hash): identical in-flight requests share one call
+    parts = []
+    for part in contents if isinstance(contents, (list, tuple)) else [contents]:
+        if isinstance(part, str):
+            parts.append(' '.join(part.split()))
+        elif hasattr(part, 'tobytes'):
+            parts.append(f"image:{part.mode}:{part.size}:{singleflight.content_hash(part.tobytes())}")
+        else:
+            parts.append(repr(part))
+    config = _freeze(getattr(model, '_generation_config', None))
+    return (model.model_name, config, tuple(parts), bool(kwargs.get('stream')))
+
+
+# mode tags the call in telemetry (draw, upload, chat, quiz, classifier); it is not sent to the API
+def generate(model, contents, mode='other', queue_timeout=ratelimit.MAX_QUEUE_SECONDS, **kwargs):
+    key = request_key(model, contents, **kwargs)
+    call = lambda: ratelimit.call(model.generate_content, contents, queue_timeout=queue_timeout, **kwargs)
+    if kwargs.get('stream'):
+        return singleflight.stream(key, lambda: telemetry.streamed(mode, telemetry.model_label(model), call))
+    return singleflight.do(key, lambda: telemetry.timed(mode, telemetry.model_label(model), call))
+
+
+def send(chat, content, mode='chat', **kwargs):
+    call = lambda: ratelimit.call(chat.send_message, content, **kwargs)
+    if kwargs.get('stream'):
+        return telemetry.streamed(mode, telemetry.model_label(chat.model), call)
+    return telemetry.timed(mode, telemetry.model_label(chat.model), call)
+
+
+# --- Streaming ---
+def stream_text(call, label='gemini'):
+    """Yield text chunks from call() (a stream=True request) and log time-to-first-token.
+
+    The SDK pulls the first chunk while building the response, so the request itself
+    is made in here to keep it inside the timed region.
+    """
+    start = time.perf_counter()
+    first_token = None
+    for chunk in call():
+        try:
+            text = chunk.text
+        except ValueError:
+            continue  # chunks with no text parts (finish reason, safety ratings)
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        yield text
+    total = time.perf_counter() - start
+    log.info("%s: first token %.2fs, total %.2fs", label, first_token if first_token is not None else total, total)
+
+
+def registry_size():
+    return len(_models)
+
+
+# --- Benchmark: python main/gemini.py [sessions] [requests_per_session] ---
+def _bench_worker(setup, api_key, requests, timings):
+    for _ in range(requests):
+        start = time.perf_counter()
+        setup(api_key)
+        timings.append(time.perf_counter() - start)
+
+
+def _per_request_setup(api_key):
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(DEFAULT_MODEL)
+
+
+def _pooled_setup(api_key):
+    return get_model(api_key)
+
+
+def _run_bench(setup, sessions, requests):
+    timings = []
+    threads = [
+        threading.Thread(target=_bench_worker, args=(setup, 'bench-key', requests, timings))
+        for _ in range(sessions)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    timings.sort()
+    return {
+        'mean_us': 1e6 * sum(timings) / len(timings),
+        'p99_us': 1e6 * timings[int(0.99 * (len(timings) - 1))],
+        'wall_s': wall,
+    }
+
+
+if __name__ == '__main__':
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"{sessions} concurrent sessions x {requests} requests")
+    for label, setup in (('per-request configure', _per_request_setup), ('pooled registry', _pooled_setup)):
+        r = _run_bench(setup, sessions, requests)
+        print(f"{label:>22}: mean {r['mean_us']:8.1f} us  p99 {r['p99_us']:8.1f} us  wall {r['wall_s']:.3f} s")
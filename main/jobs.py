@@ -0,0 +1,102 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Background jobs ---
+# Solves, quizzes and classifications run on one shared executor instead of the
+# Streamlit script thread. A job belongs to the logged-in user, not to the rerun that
+# submitted it, so it keeps running through reruns, mode switches and reloads; the
+# page polls for finished jobs from a fragment and collects each result once.
+# Job functions run outside any script context and must not call st.*.
+
+WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+MAX_PENDING_PER_USER = 5
+KEEP_SECONDS = 3600  # uncollected results are dropped after this
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_jobs = {}
+_ids = itertools.count(1)
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='job')
+stats = {'submitted': 0, 'done': 0, 'failed': 0, 'refused': 0, 'run_seconds': 0.0}
+
+
+class Job:
+    def __init__(self, job_id, owner, kind, label, meta):
+        self.id, self.owner, self.kind, self.label, self.meta = job_id, owner, kind, label, meta
+        self.status = 'queued'
+        self.result = self.error = None
+        self.created = time.time()
+        self.started = self.finished = None
+        self.collected = False
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.created
+
+
+def _run(job, fn, args):
+    job.status, job.started = 'running', time.time()
+    try:
+        result = fn(*args)
+    except Exception as e:
+        log.warning("job %s (%s) failed: %s", job.id, job.kind, e)
+        with _lock:
+            job.error, job.status = str(e), 'failed'
+            stats['failed'] += 1
+    else:
+        with _lock:
+            job.result, job.status = result, 'done'
+            stats['done'] += 1
+    finally:
+        job.finished = time.time()
+        with _lock:
+            stats['run_seconds'] += job.finished - job.started
+
+
+def _prune(now):
+    # caller holds _lock
+    for job_id in [j.id for j in _jobs.values() if j.finished and (j.collected or now - j.finished > KEEP_SECONDS)]:
+        del _jobs[job_id]
+
+
+def submit(owner, kind, label, fn, *args, **meta):
+    """Queue fn(*args) for this user; returns the job id, or None if they already have too many pending."""
+    with _lock:
+        _prune(time.time())
+        if sum(1 for j in _jobs.values() if j.owner == owner and j.finished is None) >= MAX_PENDING_PER_USER:
+            stats['refused'] += 1
+            return None
+        job = Job(next(_ids), owner, kind, label, meta)
+        _jobs[job.id] = job
+        stats['submitted'] += 1
+    _executor.submit(_run, job, fn, args)
+    return job.id
+
+
+def pending(owner):
+    with _lock:
+        return sorted((j for j in _jobs.values() if j.owner == owner and j.finished is None), key=lambda j: j.id)
+
+
+def has_jobs(owner):
+    with _lock:
+        return any(j.owner == owner and not j.collected for j in _jobs.values())
+
+
+def collect(owner):
+    """Finished jobs not handed out yet, oldest first; each job is returned once."""
+    with _lock:
+        finished = sorted((j for j in _jobs.values() if j.owner == owner and j.finished and not j.collected),
+                          key=lambda j: j.id)
+        for job in finished:
+            job.collected = True
+    return finished
+
+
+def queue_depth():
+    with _lock:
+        return sum(1 for j in _jobs.values() if j.finished is None)
@@ -0,0 +1,126 @@
+import json
+import re
+
+# --- Incremental / forgiving JSON for model output ---
+# Models wrap JSON in fences, leave trailing commas, use smart quotes or stop halfway.
+# loads() repairs those locally instead of throwing the whole generation away, and
+# ArrayItems hands out elements of a top-level list as soon as each one is complete.
+
+_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r',\s*([\]}])')
+_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def strip_fences(text):
+    return _FENCE.sub('', text.strip())
+
+
+def _scan(text):
+    """Return (stack of open brackets, in_string, index just past the top-level value or None)."""
+    stack, in_string, escape = [], False, False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+        elif ch in '}]' and stack:
+            stack.pop()
+            if not stack:
+                return stack, False, i + 1
+    return stack, in_string, None
+
+
+def _close(text):
+    stack, in_string, end = _scan(text)
+    if end is not None:
+        return text[:end]
+    if in_string:
+        text += '"'
+    text = re.sub(r'[,:\s]+$', '', text)
+    return text + ''.join(_CLOSERS[b] for b in reversed(stack))
+
+
+def repair(text):
+    """Best-effort fix of near-miss JSON: fences, prose around it, smart quotes, trailing commas, truncation."""
+    text = strip_fences(text).translate(_QUOTES)
+    starts = [i for i in (text.find('['), text.find('{')) if i >= 0]
+    if not starts:
+        return text
+    text = text[min(starts):]
+    candidates = [_close(text)]
+    # truncated mid-item: also try dropping the unfinished tail back to the last comma
+    cut = text.rfind(',')
+    if cut > 0:
+        candidates.append(_close(text[:cut]))
+    for candidate in candidates:
+        candidate = _TRAILING_COMMA.sub(r'\1', candidate)
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    return _TRAILING_COMMA.sub(r'\1', candidates[0])
+
+
+def loads(text):
+    try:
+        return json.loads(strip_fences(text))
+    except json.JSONDecodeError:
+        return json.loads(repair(text))
+
+
+def loads_partial(text):
+    """Parse whatever has arrived so far, or None."""
+    try:
+        return json.loads(repair(text))
+    except json.JSONDecodeError:
+        return None
+
+
+class ArrayItems:
+    """Feed streamed text of a JSON list; feed() returns the elements completed by that chunk."""
+
+    def __init__(self):
+        self.buf = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+
+    def feed(self, chunk):
+        self.buf += chunk
+        items = []
+        for i in range(self.pos, len(self.buf)):
+            ch = self.buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.depth += 1
+                if self.depth == 2:
+                    self.item_start = i
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 1 and self.item_start is not None:
+                    try:
+                        items.append(loads(self.buf[self.item_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+        self.pos = len(self.buf)
+        return items
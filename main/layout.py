@@ -0,0 +1,127 @@
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+import recognizer
+
+# --- Multi-problem layout analysis ---
+# A worksheet photo or a busy canvas often holds several separate problems. The page
+# is binarized at a small working size, specks are dropped using connected components,
+# and then it is cut recursively along blank bands in the row / column projection
+# profiles (XY-cut). A band only counts as a separator when it is at least
+# ROW_GAP_FACTOR / COL_GAP_FACTOR (3x) the median glyph height; ordinary line spacing
+# is well under that, so the lines of one multi-line problem stay together.
+
+WORK_LONG_EDGE = 600
+MIN_COMPONENT_AREA = 6  # pixels at working size
+ROW_GAP_FACTOR = 3.0  # blank rows, in glyph heights, that separate two problems (line spacing is ~0.5-1.5)
+COL_GAP_FACTOR = 3.0  # blank columns, in glyph heights, that separate side-by-side problems
+MIN_REGION_INK = 40  # pixels at working size; smaller regions are stray marks
+MAX_REGIONS = 12
+PAD = 12  # pixels of margin around each crop, at full size
+MAX_DEPTH = 4
+
+
+def ink_mask(gray):
+    """Dark-on-light ink as a bool array; Otsu threshold so photos with grey paper work too."""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    levels = np.arange(256)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * levels)
+    between = (mean[-1] * weight - mean * total) ** 2 / np.maximum(weight * (total - weight), 1e-9)
+    threshold = int(between.argmax())
+    mask = gray <= threshold
+    # a page that is mostly "ink" is really a light-on-dark image
+    return ~mask if mask.mean() > 0.5 else mask
+
+
+def _clean(mask):
+    """Drop specks; returns the cleaned mask and the median glyph height."""
+    cleaned = np.zeros_like(mask)
+    heights = []
+    for runs in recognizer.components(mask):
+        if sum(e - s for _, s, e in runs) < MIN_COMPONENT_AREA:
+            continue
+        rows = [r for r, _, _ in runs]
+        heights.append(max(rows) - min(rows) + 1)
+        for r, s, e in runs:
+            cleaned[r, s:e] = True
+    return cleaned, float(np.median(heights)) if heights else 0.0
+
+
+def _gaps(profile, min_gap):
+    """Split a projection profile at blank runs at least min_gap long; returns [(start, stop)] of inked spans."""
+    ink = np.concatenate([[0], (profile > 0).view(np.int8), [0]])
+    edges = np.flatnonzero(np.diff(ink))
+    spans = list(zip(edges[::2], edges[1::2]))
+    merged = []
+    for start, stop in spans:
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], stop)
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _xy_cut(mask, top, left, row_gap, col_gap, depth, out):
+    rows = _gaps(mask.sum(axis=1), row_gap)
+    if len(rows) > 1 and depth < MAX_DEPTH:
+        for start, stop in rows:
+            _xy_cut(mask[start:stop], top + start, left, row_gap, col_gap, depth + 1, out)
+        return
+    cols = _gaps(mask.sum(axis=0), col_gap)
+    if len(cols) > 1 and depth < MAX_DEPTH:
+        for start, stop in cols:
+            _xy_cut(mask[:, start:stop], top, left + start, row_gap, col_gap, depth + 1, out)
+        return
+    if mask.sum() >= MIN_REGION_INK:
+        r = np.flatnonzero(mask.any(axis=1))
+        c = np.flatnonzero(mask.any(axis=0))
+        out.append((top + r[0], top + r[-1] + 1, left + c[0], left + c[-1] + 1))
+
+
+def regions(image):
+    """Problem boxes (top, bottom, left, right) in full-size pixels, in reading order."""
+    scale = min(1.0, WORK_LONG_EDGE / max(image.size))
+    small = image.convert('L')
+    if scale < 1.0:
+        small = small.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BOX)
+    mask, glyph = _clean(ink_mask(np.asarray(small)))
+    if glyph == 0:
+        return []
+    boxes = []
+    _xy_cut(mask, 0, 0, max(2, ROW_GAP_FACTOR * glyph), max(2, COL_GAP_FACTOR * glyph), 0, boxes)
+    if len(boxes) > MAX_REGIONS:
+        return []  # dense text rather than separate problems; solve the page whole
+    return [(round(t / scale), round(b / scale), round(l / scale), round(r / scale)) for t, b, l, r in boxes]
+
+
+def split(image, pad=PAD):
+    """Crops of each separate problem; a single-problem image gives a one-item list (or [] if blank)."""
+    crops = []
+    for top, bottom, left, right in regions(image):
+        crops.append(image.crop((max(left - pad, 0), max(top - pad, 0),
+                                 min(right + pad, image.width), min(bottom + pad, image.height))))
+    return crops
+
+
+# --- Check: python main/layout.py [image ...] (default: a synthetic canvas with four problems) ---
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        images = [(path, Image.open(path)) for path in sys.argv[1:]]
+    else:
+        import preprocess
+
+        rng = np.random.default_rng(0)
+        canvas = Image.new('L', (1600, 900), 255)
+        for text, (x, y) in zip(['2+2', '15x3+20', 'x+5=10', '9/3'], [(40, 60), (840, 60), (40, 500), (840, 500)]):
+            fixture = recognizer.render_fixture(text, rng)
+            canvas.paste(preprocess.prepare_canvas(fixture, '#1A1A3D', long_edge=600), (x, y))
+        images = [('synthetic 2x2 worksheet', canvas)]
+    for name, image in images:
+        start = time.perf_counter()
+        boxes = regions(image)
+        print(f"{name}: {len(boxes)} regions in {1000 * (time.perf_counter() - start):.0f} ms: {boxes}")
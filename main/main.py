@@ -1,9 +1,12 @@
 import streamlit as st
 from streamlit_drawable_canvas import st_canvas
 from PIL import Image
-import google.generativeai as genai
 import io
 import fun
+import gemini
+import ratelimit
+import preprocess
+import strokes
 import time
 import random
 # Page config
@@ -71,19 +74,12 @@ if st.session_state['authentication_status']:
         st.markdown("- Calculus, algebra, geometry")
 
     # Function to initialize Gemini model
-    def get_gemini_model(api_key):
-        try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
-            return model, None
-        except Exception as e:
-            return None, str(e)
+    get_gemini_model = gemini.get_gemini_model
 
     # Function to process image with Gemini
     def solve_with_gemini(image_data, api_key, is_pil=False):
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.0-flash-exp')
+            model = gemini.get_model(api_key)
             
             # Handle different image inputs
             if is_pil:
@@ -108,7 +104,7 @@ if st.session_state['authentication_status']:
     Be thorough and educational in your explanation."""
             
             # Generate response
-            response = model.generate_content([prompt, rgb_img])
+            response = gemini.generate(model, [prompt, rgb_img])
             return response.text
             
         except Exception as e:
@@ -118,8 +114,7 @@ if st.session_state['authentication_status']:
     def get_chat_session(api_key):
         try:
             if st.session_state.chat_session is None:
-                genai.configure(api_key=api_key)
-                model = genai.GenerativeModel('gemini-2.0-flash-exp')
+                model = gemini.get_model(api_key)
                 st.session_state.chat_session = model.start_chat(history=[])
             return st.session_state.chat_session
         except Exception as e:
@@ -158,13 +153,13 @@ if st.session_state['authentication_status']:
                             if chat:
                                 # Send message with math tutor context
                                 full_prompt = f"You are a helpful and patient math tutor. Help the student with their question: {prompt}"
-                                response = chat.send_message(full_prompt)
+                                response = gemini.send(chat, full_prompt)
                                 response_text = response.text
                             else:
                                 response_text = "❌ Could not initialize chat session. Please check your API key."
                         except Exception as e:
-                            error_msg = str(e)
-                            if "429" in error_msg or "quota" in error_msg.lower():
+                            # the limiter already retried with backoff; this is a real quota wall
+                            if isinstance(e, ratelimit.QuotaExceeded):
                                 st.error("❌ You've hit the **Gemini API quota limit** for today. Please wait or use another API key.")
                                                 
                         
@@ -196,6 +191,7 @@ if st.session_state['authentication_status']:
                     "Drawing tool:", ("freedraw", "line", "rect", "circle", "transform")
                 )
                 realtime_update = st.sidebar.checkbox("Update in realtime", True)
+                vector_mode = st.sidebar.checkbox("Vector strokes", help="Keep only the stroke paths and render them when you press Solve")
 
                 # Canvas for drawing
                 canvas_result = st_canvas(
@@ -221,7 +217,11 @@ if st.session_state['authentication_status']:
                 #     key="canvas",
                 # )
                 
-                image_to_process = canvas_result.image_data if canvas_result.image_data is not None else None
+                if vector_mode:
+                    st.session_state.strokes = strokes.from_json(canvas_result.json_data, bg_color)
+                    image_to_process = st.session_state.strokes if strokes.count(st.session_state.strokes) else None
+                else:
+                    image_to_process = canvas_result.image_data if canvas_result.image_data is not None else None
                 is_pil = False
             
             else:  # Upload Image mode
@@ -259,6 +259,12 @@ if st.session_state['authentication_status']:
         
         # Process when solve button is clicked
         if solve_button:
+            if mode == "✏️ Draw" and image_to_process is not None:
+                if vector_mode:
+                    image_to_process = strokes.rasterize(image_to_process)
+                else:
+                    image_to_process = preprocess.prepare_canvas(image_to_process, bg_color)
+                is_pil = True
             if not api_key:
                 st.error("⚠️ Please enter your Gemini API key in the sidebar!")
             elif image_to_process is None:
@@ -4,7 +4,39 @@ from PIL import Image
 import google.generativeai as genai
 import io
 import json # Import the JSON library
+import logging
+import time
 import fun
+import gemini
+import solve_cache
+import preprocess
+import strokes
+import mathengine
+import recognizer
+import quiz_pool
+import classifier
+import jsonstream
+import difficulty_model
+import ratelimit
+import singleflight
+import chat_context
+import transcript
+import semantic_cache
+import auth_cache
+import session_store
+import jobs
+import batch
+import layout
+import telemetry
+import profiler
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+telemetry.serve()  # once per process; later reruns find it running
+recognizer.warm_up()  # trains the offline reader in the background; Draw uses Gemini until it is ready
+
+# section timing for this rerun (PROFILE_RERUNS=1 or an admin's toggle); see profiler
+profile_run = profiler.begin(st.session_state, profiler.ENABLED or st.session_state.get('profile_reruns', False))
+profile_run.mark("page config + CSS")
 
 # Page config must be the first Streamlit command
 st.set_page_config(page_title="AI Math Assistant", page_icon="🧮", layout="wide")
@@ -99,6 +131,7 @@ div[data-baseweb="slider"] > div > div {
 st.markdown(page_bg_img, unsafe_allow_html=True)
 
 # login_register function call
+profile_run.mark("login")
 fun.login_register_page()
 
 if st.session_state['authentication_status']:
@@ -109,10 +142,13 @@ if st.session_state['authentication_status']:
     st.markdown("<h1 style='color:#33E6F6'>Draw, upload, or chat about math problems!</h1>",unsafe_allow_html=True)
 
     # --- Session State Initializations ---
+    profile_run.mark("session state")
     if 'messages' not in st.session_state:
         st.session_state.messages = []
     if 'chat_session' not in st.session_state:
         st.session_state.chat_session = None
+    if 'chat_context' not in st.session_state:
+        st.session_state.chat_context = chat_context.ChatContext()
     if 'quiz_questions' not in st.session_state:
         st.session_state.quiz_questions = []
     if 'current_question_index' not in st.session_state:
@@ -130,12 +166,57 @@ if st.session_state['authentication_status']:
     if 'previous_mode' not in st.session_state:
         st.session_state.previous_mode = None
 
+    # --- Durable per-user state: restored on login, afterwards only changes are appended ---
+    username = st.session_state['username']
+    if st.session_state.get('restored_user') != username:
+        session_store.restore(username, st.session_state)
+        st.session_state.restored_user = username
+    else:
+        session_store.sync(username, st.session_state)  # catches runs that ended in st.rerun()
+
     # --- Function Definitions ---
     def clear_solution_state():
         st.session_state.solution_result = None
         st.session_state.feedback_given = None
 
+    def apply_job_result(job):
+        if job.kind == 'solve':
+            st.session_state.solution_result = job.result if job.error is None else f"❌ Error: {job.error}"
+            st.session_state.feedback_given = None
+        elif job.error is not None:
+            st.toast(f"❌ {job.label} failed: {job.error}")
+        elif job.kind == 'quiz':
+            quiz_pool.mark_seen(username, job.result)
+            st.session_state.quiz_questions = job.result
+            st.session_state.current_question_index = 0
+            st.session_state.user_answers = []
+            st.session_state.quiz_started = True
+        elif job.kind == 'classify':
+            result, source = job.result
+            st.session_state.classification_result = {'problem': job.meta['problem'], 'result': result, 'source': source}
+        st.toast(f"✅ {job.label} is ready")
+
+    # polls only while this user has jobs; a finished job reruns the whole page to show its result
+    @st.fragment(run_every=1.0)
+    def job_panel():
+        finished = jobs.collect(username)
+        for job in finished:
+            apply_job_result(job)
+        if finished:
+            st.rerun()
+        for job in jobs.pending(username):
+            st.caption(f"⏳ {job.label}: {job.status} · {job.elapsed():.0f}s")
+
+    def submit_job(kind, label, fn, *args, **meta):
+        job_id = jobs.submit(username, kind, label, fn, *args, **meta)
+        if job_id is None:
+            st.warning(f"⚠️ You already have {jobs.MAX_PENDING_PER_USER} jobs running. Please wait for one to finish.")
+        else:
+            st.toast(f"🧵 {label} started in the background")
+        return job_id
+
     # --- Sidebar ---
+    profile_run.mark("sidebar")
     with st.sidebar:
         st.header("⚙️ Configuration")
         api_key = st.secrets["GOOGLE_API_KEY"]
@@ -143,7 +224,7 @@ if st.session_state['authentication_status']:
         st.header("📋 Mode")
         mode = st.radio(
             "Choose input mode:",
-            ["✏️ Draw", "📤 Upload Image", "💬 Chat", "🎯 Quiz", "🔮 Classifier"],
+            ["✏️ Draw", "📤 Upload Image", "💬 Chat", "🎯 Quiz", "🔮 Classifier"] + (["📊 Telemetry"] if fun.is_admin() else []),
             label_visibility="collapsed"
         )
 
@@ -163,44 +244,109 @@ if st.session_state['authentication_status']:
             st.markdown("1. Select a topic\n2. Start the quiz\n3. Test your knowledge!")
         elif mode == "🔮 Classifier":
             st.markdown("1. Type a problem\n2. Click 'Analyze'\n3. Get its difficulty!")
+        elif mode == "📊 Telemetry":
+            st.markdown("1. Watch Gemini latency and errors\n2. Point Prometheus at the metrics endpoint")
         else: # Chat mode
             st.markdown("1. Type a question\n2. Get explanations\n3. Chat about math!")
         
+        if mode in ("✏️ Draw", "📤 Upload Image"):
+            cache_stats = solve_cache.stats
+            st.caption(f"♻️ Solution cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits / "
+                       f"{cache_stats['misses']} misses ({solve_cache.hit_rate():.0%} of API calls saved)")
+            if mode == "✏️ Draw":
+                st.caption(f"✍️ Read offline: {recognizer.stats['local']} drawings, "
+                           f"{recognizer.stats['fallback']} sent to Gemini")
+
+        if mode in ("💬 Chat", "🔮 Classifier"):
+            st.caption(f"🧠 Local math engine: {mathengine.stats['local']} answered "
+                       f"({mathengine.hit_rate():.0%} hit rate, {mathengine.mean_latency_ms():.2f} ms avg)")
+        if mode == "🔮 Classifier":
+            st.caption(f"🪶 Distilled classifier: {difficulty_model.stats['local']} answered locally, "
+                       f"{difficulty_model.stats['escalated']} escalated to Gemini")
+
         if mode == "💬 Chat":
+            context = st.session_state.chat_context
+            st.caption(f"🧾 Chat context: ~{context.last_input_tokens} input tokens last turn, "
+                       f"{context.summarized} older messages summarized")
+            st.caption(f"♻️ Question cache: {semantic_cache.stats['hits']} hits / {semantic_cache.stats['misses']} misses "
+                       f"({semantic_cache.hit_rate():.0%}), {semantic_cache.size()} answers stored")
+
             def clear_chat_history():
                 st.session_state.messages = []
                 st.session_state.chat_session = None
+                st.session_state.chat_context = chat_context.ChatContext()
+                transcript.reset()
             
             st.button("🗑️ Clear Chat History", on_click=clear_chat_history, use_container_width=True)
 
+        queue_stats = ratelimit.limiter.stats
+        avg_wait = queue_stats['queue_seconds'] / queue_stats['queued'] if queue_stats['queued'] else 0.0
+        st.caption(f"🚦 Gemini queue: {queue_stats['queued']} of {queue_stats['requests']} requests delayed "
+                   f"(avg {avg_wait:.1f}s), {queue_stats['throttled']} throttled, {queue_stats['rejected']} refused")
+        st.caption(f"🔗 Coalesced: {singleflight.stats['followers']} requests shared an in-flight call "
+                   f"({singleflight.coalescing_ratio():.0%})")
+        st.caption(f"🔐 Auth: {auth_cache.mean_rerun_ms():.1f} ms per rerun, "
+                   f"{auth_cache.stats['resumed']} sessions resumed from verified cookies")
+
+        stream_responses = st.toggle("⚡ Stream responses", value=True, help="Show answers as they are generated")
+        run_in_background = st.toggle("🧵 Run in background", value=False,
+                                      help="Keep drawing or switch modes while solves, quizzes and classifications run; "
+                                           "results appear when ready (not streamed)")
+        if fun.is_admin() and not profiler.ENABLED:
+            st.toggle("⏱️ Profile reruns", key='profile_reruns', help="Time each section of the script on every rerun")
+        if jobs.has_jobs(username):
+            job_panel()
         st.markdown("---")
 
-    def get_gemini_model(api_key, model_name='gemini-2.0-flash-exp'):
-        try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(model_name)
-            return model, None
-        except Exception as e:
-            return None, str(e)
+    # models come from the process-wide registry in gemini.py
+    get_gemini_model = gemini.get_gemini_model
+
+    SOLVE_PROMPT = """Analyze this mathematical expression. Solve it step-by-step and provide a final answer in the format: **Answer:** [final answer]"""
 
-    def solve_with_gemini(image_data, api_key, is_pil=False):
+    def solve_with_gemini(image_data, api_key, is_pil=False, live=None):
         model, error = get_gemini_model(api_key)
         if error: return f"❌ Error initializing model: {error}"
         try:
-            if is_pil: rgb_img = image_data.convert('RGB')
+            if is_pil: rgb_img = image_data if image_data.mode == 'RGB' else image_data.convert('RGB')
             else:
                 img = Image.fromarray(image_data.astype('uint8'), 'RGBA')
                 rgb_img = Image.new('RGB', img.size, (255, 255, 255))
                 rgb_img.paste(img, mask=img.split()[3])
-            prompt = """Analyze this mathematical expression. Solve it step-by-step and provide a final answer in the format: **Answer:** [final answer]"""
-            response = model.generate_content([prompt, rgb_img])
-            return response.text
+            cache_key = solve_cache.make_key(rgb_img, SOLVE_PROMPT)
+            cached = solve_cache.get(cache_key)
+            if cached is not None: return cached
+            tag = 'draw' if mode == "✏️ Draw" else 'upload'
+            if live is not None:
+                # stream into the given container; the final text is still returned for solution_result
+                text = live.write_stream(gemini.stream_text(lambda: gemini.generate(model, [SOLVE_PROMPT, rgb_img], mode=tag, stream=True), "solve"))
+            else:
+                text = gemini.generate(model, [SOLVE_PROMPT, rgb_img], mode=tag).text
+            solve_cache.put(cache_key, text)
+            return text
         except Exception as e: return f"❌ Error: {str(e)}"
 
+    def solve_batch(pages, api_key):
+        # pages are solved concurrently; each answer fills its own slot, so the layout stays in page order
+        solve = lambda image: solve_with_gemini(image, api_key, is_pil=True)
+        labels = [label for label, _, _ in pages]
+        live = st.container(border=True)
+        slots = []
+        for label in labels:
+            live.markdown(f"### {label}")
+            slots.append(live.empty())
+            slots[-1].caption("⏳ Solving...")
+        results = [None] * len(pages)
+        start = time.perf_counter()
+        for i, text in batch.solve_pages([image for _, image, _ in pages], solve):
+            results[i] = text
+            slots[i].markdown(text)
+        wall = time.perf_counter() - start
+        return batch.combined(labels, results) + f"\n\n*{len(pages)} pages solved in {wall:.1f}s*"
+
     def get_chat_session(api_key):
         if 'chat_session' not in st.session_state or st.session_state.chat_session is None:
             try:
-                model, error = get_gemini_model(api_key)
+                model, error = get_gemini_model(api_key, system_instruction=chat_context.PERSONA)
                 if error:
                     st.error(f"Error initializing chat: {error}")
                     return None
@@ -210,34 +356,59 @@ if st.session_state['authentication_status']:
                 return None
         return st.session_state.chat_session
 
-    def generate_quiz(topic, difficulty, api_key):
-        model, error = get_gemini_model(api_key)
+    def generate_quiz(topic, difficulty, api_key, stream=False):
+        model, error = get_gemini_model(api_key, generation_config=quiz_pool.GENERATION_CONFIG)
         if error:
             st.error(f"Error initializing model for quiz: {error}")
             return None
-        prompt = f"""You are a quiz generator. Create a 5-question multiple-choice quiz about {topic} at a {difficulty} level. Return the quiz as a valid JSON list. Each object must have keys: "question", "options" (a list of 4 strings), and "answer" (the correct option string). Do not include any text before or after the JSON list."""
+        prompt = quiz_pool.quiz_prompt(topic, difficulty)
         try:
-            with st.spinner(f"Generating a {difficulty} {topic} quiz..."):
-                response = model.generate_content(prompt)
-                json_text = response.text.strip().replace("```json", "").replace("```", "")
-                questions = json.loads(json_text)
-                return questions
+            if stream:
+                with st.status(f"Generating a {difficulty} {topic} quiz...", expanded=True) as status:
+                    # show each question as soon as its JSON object is complete
+                    items, chunks = jsonstream.ArrayItems(), []
+                    for chunk in gemini.stream_text(lambda: gemini.generate(model, prompt, mode='quiz', stream=True), "quiz"):
+                        chunks.append(chunk)
+                        for q in items.feed(chunk):
+                            if isinstance(q, dict) and q.get('question'):
+                                st.markdown(f"✅ {q['question']}")
+                    text = ''.join(chunks)
+                    status.update(label="Quiz generated", state="complete", expanded=False)
+            else:
+                with st.spinner(f"Generating a {difficulty} {topic} quiz..."):
+                    text = gemini.generate(model, prompt, mode='quiz').text
+            questions = quiz_pool.parse_quiz(text)
+            if questions is None:
+                st.error("❌ The generated quiz was incomplete. Please try again.")
+            return questions
         except Exception as e:
             st.error(f"❌ Failed to generate or parse quiz. Error: {e}")
             return None
 
     # --- Main App Logic ---
+    profile_run.mark(f"body: {mode}")
 
     if mode == "🎯 Quiz":
         st.subheader("🎯 Test Your Knowledge!")
         if not st.session_state.quiz_started:
+            if api_key: quiz_pool.ensure_started(api_key)
             quiz_col1, quiz_col2 = st.columns(2)
-            with quiz_col1: topic = st.selectbox("Choose a topic:", ["Algebra", "Calculus", "Geometry", "Trigonometry"])
-            with quiz_col2: difficulty = st.selectbox("Choose difficulty:", ["Easy", "Medium", "Hard"])
+            with quiz_col1: topic = st.selectbox("Choose a topic:", quiz_pool.TOPICS)
+            with quiz_col2: difficulty = st.selectbox("Choose difficulty:", quiz_pool.DIFFICULTIES)
+            ready = quiz_pool.depth()
+            st.caption(f"⚡ {ready[(topic, difficulty)]} {difficulty} {topic} quizzes ready · "
+                       f"{sum(ready.values())} in pool · avg refill {quiz_pool.mean_refill_seconds():.1f}s")
             if st.button("🚀 Start Quiz", use_container_width=True):
                 if not api_key: st.error("⚠️ Please enter your Gemini API key!")
                 else:
-                    questions = generate_quiz(topic, difficulty, api_key)
+                    # served from the prefetched pool when possible, generated on the spot otherwise
+                    questions = quiz_pool.take(topic, difficulty, st.session_state['username'])
+                    if questions is None and run_in_background:
+                        if submit_job('quiz', f"{difficulty} {topic} quiz", quiz_pool.generate, api_key, topic, difficulty):
+                            st.rerun()
+                    elif questions is None:
+                        questions = generate_quiz(topic, difficulty, api_key, stream_responses)
+                        if questions: quiz_pool.mark_seen(st.session_state['username'], questions)
                     if questions:
                         st.session_state.quiz_questions = questions
                         st.session_state.current_question_index = 0
@@ -285,71 +456,195 @@ if st.session_state['authentication_status']:
         if not st.session_state.messages:
             with st.chat_message("assistant"):
                 st.write("Hello! How can I help you with your math problems today? 🤖")
-        for msg in st.session_state.messages:
-            with st.chat_message(msg["role"]): st.markdown(msg["content"])
+        # only the newest messages are rendered; older ones load on demand
+        transcript.render(st.session_state.messages)
         if prompt := st.chat_input("Ask me anything about math..."):
             if not api_key: st.error("⚠️ Please enter your Gemini API key!")
             else:
+                # an opening question has no context yet, so a close earlier one can share its answer
+                first_turn = not st.session_state.messages
                 st.session_state.messages.append({"role": "user", "content": prompt})
                 with st.chat_message("user"): st.markdown(prompt)
+                context = st.session_state.chat_context
                 with st.chat_message("assistant"):
-                    with st.spinner("Thinking..."):
+                    # plain arithmetic and linear/quadratic equations are answered locally
+                    response_text = mathengine.solve(prompt)
+                    cached = semantic_cache.lookup(prompt) if response_text is None and first_turn else None
+                    if response_text is not None:
+                        st.markdown(response_text)
+                    elif cached is not None:
+                        response_text, similar_question, similarity = cached
+                        st.markdown(response_text)
+                        st.caption(f"♻️ Answer reused from a similar question: \"{similar_question}\" ({similarity:.0%} match)")
+                    else:
+                        # the persona is the model's system instruction; history is the bounded context
                         chat = get_chat_session(api_key)
-                        response = chat.send_message(f"You are a helpful math tutor developed by O(1) Squad. The members are Dev Soni(Leader), Sunny Yadav, Rishi Bisht. Help with: {prompt}")
-                        response_text = response.text
-                    st.markdown(response_text)
-                st.session_state.messages.append({"role": "assistant", "content": response_text})
+                        try:
+                            context.prepare(chat, prompt)
+                            if stream_responses:
+                                response_text = st.write_stream(gemini.stream_text(lambda: gemini.send(chat, prompt, stream=True), "chat"))
+                            else:
+                                with st.spinner("Thinking..."):
+                                    response_text = gemini.send(chat, prompt).text
+                                st.markdown(response_text)
+                            if first_turn:
+                                semantic_cache.store(prompt, response_text)
+                        except ratelimit.QuotaExceeded:
+                            st.error("❌ You've hit the **Gemini API quota limit**. Please wait a minute and try again.")
+                        except Exception as e:
+                            st.error(f"❌ Error: {e}")
+                if response_text is not None:
+                    st.session_state.messages.append({"role": "assistant", "content": response_text})
+                    context.add('user', prompt)
+                    context.add('assistant', response_text)
+                    if context.needs_refresh():
+                        context.refresh_summary(api_key)
 
     elif mode == "🔮 Classifier":
         st.subheader("🔮 Problem Difficulty Classifier")
         st.markdown("<p style='color:#C0C0FF'>Paste a math problem below to analyze its difficulty and the concepts required to solve it.</p>", unsafe_allow_html=True)
         problem_text = st.text_area("Enter math problem here:", height=150, placeholder="e.g., Find the integral of x^2 from 0 to 1.")
 
+        def show_classification(result):
+            difficulty = result.get('difficulty', "N/A")
+            concepts = result.get('required_concepts', [])
+
+            st.markdown("### Analysis Result")
+            st.metric(label="Predicted Difficulty", value=difficulty)
+            
+            st.markdown("#### Key Concepts Required:")
+            if concepts:
+                for concept in concepts:
+                    st.markdown(f"- {concept}")
+            else:
+                st.markdown("No concepts identified.")
+
         if st.button("🔬 Analyze Problem", use_container_width=True, type="primary"):
-            if not api_key:
-                st.error("⚠️ Please provide your Gemini API key!")
-            elif not problem_text.strip():
+            local_result = None
+            if problem_text.strip():
+                # exact engine first, then the model distilled from earlier Gemini labels
+                local_result = mathengine.classify(problem_text) or difficulty_model.predict(problem_text)
+            if not problem_text.strip():
                 st.warning("⚠️ Please enter a math problem to analyze.")
+            elif local_result is not None:
+                show_classification(local_result)
+            elif not api_key:
+                st.error("⚠️ Please provide your Gemini API key!")
+            elif run_in_background:
+                st.session_state.classification_result = None
+                if submit_job('classify', "Classification", classifier.classify, problem_text, api_key, problem=problem_text):
+                    st.rerun()
             else:
-                model, error = get_gemini_model(api_key, model_name='gemini-2.0-flash-exp')
+                model, error = get_gemini_model(api_key, model_name='gemini-2.0-flash-exp', generation_config=classifier.GENERATION_CONFIG)
                 if error:
                     st.error(f"Error initializing model: {error}")
                 else:
-                    prompt = f"""
-                    Analyze the following math problem. Classify its difficulty into one of four categories: Easy, Medium, Hard, or Advanced. 
-                    Also, list the key mathematical concepts required to solve it. 
-
-                    Problem: '{problem_text}'
-
-                    Return a single, valid JSON object with two keys: "difficulty" (a string from the categories) and "required_concepts" (a list of strings). 
-                    Do not include any text, explanation, or markdown formatting before or after the JSON object.
-                    """
+                    prompt = classifier.classifier_prompt(problem_text)
                     
-                    with st.spinner("Analyzing problem complexity..."):
+                    response_text = None
+                    with st.status("Analyzing problem complexity...", expanded=stream_responses) as status:
                         try:
-                            response = model.generate_content(prompt)
-                            json_text = response.text.strip().replace("```json", "").replace("```", "")
-                            result = json.loads(json_text)
-
-                            difficulty = result.get('difficulty', "N/A")
-                            concepts = result.get('required_concepts', [])
-
-                            st.markdown("### Analysis Result")
-                            st.metric(label="Predicted Difficulty", value=difficulty)
-                            
-                            st.markdown("#### Key Concepts Required:")
-                            if concepts:
-                                for concept in concepts:
-                                    st.markdown(f"- {concept}")
+                            if stream_responses:
+                                # update a live preview from the partial JSON as it streams
+                                preview, chunks = st.empty(), []
+                                for chunk in gemini.stream_text(lambda: gemini.generate(model, prompt, mode='classifier', stream=True), "classifier"):
+                                    chunks.append(chunk)
+                                    partial = classifier.normalize(jsonstream.loads_partial(''.join(chunks)))
+                                    if partial:
+                                        preview.markdown(f"**{partial['difficulty']}** · {', '.join(partial['required_concepts'])}")
+                                response_text = ''.join(chunks)
                             else:
-                                st.markdown("No concepts identified.")
+                                response_text = gemini.generate(model, prompt, mode='classifier').text
+                            status.update(label="Analysis complete", state="complete", expanded=False)
+                        except Exception as e:
+                            status.update(label="Analysis failed", state="error")
+                            st.error(f"❌ An error occurred during analysis. Error: {e}")
 
+                    if response_text is not None:
+                        try:
+                            result = classifier.parse_result(response_text)
+                            show_classification(result)
+                            difficulty_model.log_label(problem_text, result)
                         except json.JSONDecodeError:
                             st.error("❌ The model returned an invalid format. Could not parse the analysis.")
-                            st.text_area("Model's Raw Response:", response.text if 'response' in locals() else "No response generated.")
+                            st.text_area("Model's Raw Response:", response_text)
                         except Exception as e:
                             st.error(f"❌ An error occurred during analysis. Error: {e}")
 
+        elif st.session_state.get('classification_result'):
+            # finished in the background
+            st.caption(f"Result for: {st.session_state.classification_result['problem'][:120]}")
+            show_classification(st.session_state.classification_result['result'])
+
+        # --- Bulk mode: a whole worksheet at once ---
+        if 'bulk_results' not in st.session_state:
+            st.session_state.bulk_results = None
+        with st.expander("📚 Bulk mode: classify a CSV / JSONL worksheet"):
+            bulk_file = st.file_uploader("Upload problems", type=["csv", "jsonl"], help="CSV with a 'problem' column, or one JSON object per line")
+            bulk_max = classifier.max_workers()
+            bulk_workers = st.slider("Parallel requests:", 1, bulk_max, min(4, bulk_max)) if bulk_max > 1 else 1
+            st.caption(f"Paced by the shared Gemini limit of {ratelimit.RPM} requests/minute.")
+            if st.button("📊 Classify All", use_container_width=True, disabled=bulk_file is None):
+                try:
+                    problems, skipped = classifier.read_problems(bulk_file.name, bulk_file.getvalue())
+                except Exception as e:
+                    problems, skipped = [], 0
+                    st.warning(f"⚠️ Could not read {bulk_file.name}: {e}")
+                if skipped:
+                    st.warning(f"⚠️ Skipped {skipped} line(s) that are not valid JSON.")
+                if not problems:
+                    st.warning("⚠️ No problems found in the file.")
+                elif not api_key:
+                    st.error("⚠️ Please provide your Gemini API key!")
+                else:
+                    rows = [None] * len(problems)
+                    throughput, progress, table = st.empty(), st.progress(0.0), st.empty()
+                    start, done = time.perf_counter(), 0
+                    for i, result, source, error in classifier.classify_many(problems, api_key, bulk_workers):
+                        done += 1
+                        rows[i] = {
+                            'row': i + 1,
+                            'problem': problems[i],
+                            'difficulty': result['difficulty'] if result else f"❌ {error}",
+                            'required_concepts': ', '.join(result['required_concepts']) if result else '',
+                            'source': source,
+                        }
+                        elapsed = time.perf_counter() - start
+                        throughput.metric("Throughput", f"{60 * done / elapsed:.0f} rows/min", f"{done}/{len(problems)} done")
+                        progress.progress(done / len(problems))
+                        table.dataframe([r for r in rows if r], use_container_width=True, hide_index=True)
+                    st.session_state.bulk_results = rows
+            if st.session_state.bulk_results:
+                st.download_button("⬇️ Download results (CSV)", classifier.results_csv(st.session_state.bulk_results),
+                                   file_name="classified_problems.csv", mime="text/csv", use_container_width=True)
+
+    elif mode == "📊 Telemetry":
+        st.subheader("📊 Gemini Telemetry")
+        # admins only (see fun.is_admin); numbers are for this server process since it started
+        rows = telemetry.summary()
+        calls = sum(r['calls'] for r in rows)
+        errors = sum(r['errors'] for r in rows)
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Gemini calls", calls)
+        col2.metric("Error rate", f"{errors / calls:.1%}" if calls else "–")
+        col3.metric("Tokens in / out", f"{sum(r['input tokens'] for r in rows)} / {sum(r['output tokens'] for r in rows)}")
+        col4.metric("Jobs queued", jobs.queue_depth())
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True,
+                         column_config={'error rate': st.column_config.NumberColumn(format="percent"),
+                                        'mean s': st.column_config.NumberColumn(format="%.2f"),
+                                        'p50 s': st.column_config.NumberColumn(format="%.2f"),
+                                        'p95 s': st.column_config.NumberColumn(format="%.2f")})
+        else:
+            st.info("No Gemini calls yet.")
+        port = telemetry.serve()
+        if port:
+            st.caption(f"📈 Prometheus endpoint: http://{telemetry.METRICS_HOST}:{port}/metrics")
+        with st.expander("Raw metrics"):
+            st.code(telemetry.render(), language="text")
+        if st.button("🔄 Refresh", use_container_width=True):
+            st.rerun()
+
     else: # Draw or Upload Mode
         if mode == "✏️ Draw":
             st.subheader("📐 Draw Your Expression")
@@ -362,6 +657,7 @@ if st.session_state['authentication_status']:
                 bg_color = st.color_picker("Background:", "#1A1A3D") # Dark Navy Canvas
                 drawing_tool_choice = st.selectbox("Drawing tool:", ("freedraw", "line", "rect", "circle", "transform"))
                 use_eraser = st.checkbox("Use Eraser")
+                vector_mode = st.checkbox("Vector strokes", help="Keep only the stroke paths and render them when you press Solve")
                 if use_eraser:
                     final_stroke_color = bg_color
                     final_drawing_tool = "freedraw"
@@ -383,29 +679,86 @@ if st.session_state['authentication_status']:
                     display_toolbar=False,
                     key=f"canvas_{st.session_state.canvas_clear_key}"
                 )
-            image_to_process = canvas_result.image_data if canvas_result.image_data is not None else None
+            if vector_mode:
+                # keep the compact stroke arrays, not the 1200x605 RGBA frame
+                st.session_state.strokes = strokes.from_json(canvas_result.json_data, bg_color)
+                image_to_process = st.session_state.strokes if strokes.count(st.session_state.strokes) else None
+            else:
+                image_to_process = canvas_result.image_data if canvas_result.image_data is not None else None
             is_pil = False
+            pages = []
 
         else: # Upload Image mode
             st.subheader("📤 Upload Math Problem Image")
-            uploaded_file = st.file_uploader("Choose an image", type=["png", "jpg"], on_change=clear_solution_state)
-            if uploaded_file:
-                image = Image.open(uploaded_file)
-                st.image(image, caption="Uploaded Image", use_container_width=True)
-                image_to_process = image; is_pil = True
+            uploaded_files = st.file_uploader("Choose images or a PDF", type=["png", "jpg", "jpeg", "pdf"],
+                                              accept_multiple_files=True, on_change=clear_solution_state)
+            # decode once per upload, not on every rerun; only the model-sized copy and a thumbnail are kept
+            upload_key = tuple(f.file_id for f in uploaded_files)
+            if st.session_state.get('upload_key') != upload_key:
+                st.session_state.upload_pages = batch.load_pages(uploaded_files)
+                st.session_state.upload_key = upload_key
+            pages, page_errors = st.session_state.upload_pages
+            for error in page_errors: st.warning(f"⚠️ {error}")
+            if len(pages) == 1:
+                st.image(pages[0][2], caption="Uploaded Image", use_container_width=True)
+                image_to_process = pages[0][1]; is_pil = True
+            elif pages:
+                st.caption(f"📄 {len(pages)} pages, solved in parallel")
+                thumb_cols = st.columns(min(len(pages), 5))
+                for i, (label, _, thumb) in enumerate(pages):
+                    thumb_cols[i % len(thumb_cols)].image(thumb, caption=label, use_container_width=True)
+                image_to_process = None; is_pil = True
             else:
                 image_to_process = None; is_pil = False
         
         st.markdown("---")
+        split_problems = st.checkbox("🧩 Solve separate problems separately", value=False,
+                                     help="The page holds several unrelated problems: find each one and solve them in parallel")
 
         if st.button("🎯 Solve Expression", type="primary", use_container_width=True):
-            if not api_key: st.error("⚠️ Please enter your Gemini API key!")
+            if mode == "✏️ Draw" and image_to_process is not None:
+                # crop to the ink and shrink; a blank canvas comes back as None and never hits the API
+                if vector_mode: image_to_process = strokes.rasterize(image_to_process)
+                else: image_to_process = preprocess.prepare_canvas(image_to_process, bg_color)
+                is_pil = True
+            # simple drawn arithmetic is read and solved on the CPU; anything unclear goes to Gemini
+            local_answer = recognizer.solve(image_to_process) if mode == "✏️ Draw" and image_to_process is not None else None
+            if local_answer is not None:
+                st.session_state.solution_result = local_answer
+                st.session_state.feedback_given = None
+                st.rerun()
+            elif not api_key: st.error("⚠️ Please enter your Gemini API key!")
+            elif len(pages) > 1:
+                st.session_state.solution_result = solve_batch(pages, api_key)
+                st.session_state.feedback_given = None
+                st.rerun()
             elif image_to_process is None: st.warning(f"⚠️ Please {'draw' if mode == '✏️ Draw' else 'upload an image'} first!")
+            elif (st.session_state.get('last_solve_key') == singleflight.content_hash(image_to_process.tobytes())
+                  and st.session_state.solution_result and not st.session_state.solution_result.startswith("❌")):
+                # same image clicked again: keep the answer we already have
+                st.toast("Already solved — showing the existing answer.")
+            elif split_problems and len(crops := layout.split(image_to_process)) > 1:
+                # several problems on one page: each crop is solved on its own, all at once. Crops go to
+                # Gemini only; a crop may be one line of a longer problem, which the offline reader would answer alone
+                st.session_state.last_solve_key = singleflight.content_hash(image_to_process.tobytes())
+                st.session_state.solution_result = solve_batch(
+                    [(f"Problem {i + 1}", crop, None) for i, crop in enumerate(crops)], api_key)
+                st.session_state.feedback_given = None
+                st.rerun()
             else:
-                with st.spinner("🔍 Analyzing your image..."):
-                    st.session_state.solution_result = solve_with_gemini(image_to_process, api_key, is_pil)
+                st.session_state.last_solve_key = singleflight.content_hash(image_to_process.tobytes())
+                if run_in_background:
+                    # the answer lands in solution_result when the job panel collects it
+                    if submit_job('solve', "Solve", solve_with_gemini, image_to_process, api_key, is_pil):
+                        st.rerun()
+                else:
+                    if stream_responses:
+                        st.session_state.solution_result = solve_with_gemini(image_to_process, api_key, is_pil, live=st.container(border=True))
+                    else:
+                        with st.spinner("🔍 Analyzing your image..."):
+                            st.session_state.solution_result = solve_with_gemini(image_to_process, api_key, is_pil)
                     st.session_state.feedback_given = None
-                st.rerun()
+                    st.rerun()
 
         st.markdown("---")
         
@@ -429,17 +782,43 @@ if st.session_state['authentication_status']:
                 elif st.session_state.feedback_given == 'correct':
                     st.success("✅ Great! Analysis complete.")
                     if st.button("💬 Continue this in chat mode"):
-                        st.session_state.messages.append({"role": "assistant", "content": f"I just solved this problem:\n\n{st.session_state.solution_result}"})
+                        solved = f"I just solved this problem:\n\n{st.session_state.solution_result}"
+                        st.session_state.messages.append({"role": "assistant", "content": solved})
+                        st.session_state.chat_context.add('assistant', solved)
                         st.info("Added to chat history! Switch to 'Chat' mode to continue.")
                 elif st.session_state.feedback_given == 'incorrect':
                     st.warning("Thanks for the feedback! We'll use this to improve.")
                 
                 st.button("🗑️ Clear AI Solution", use_container_width=True, on_click=clear_solution_state)
 
+    profile_run.mark("footer + save")
     if mode != "💬 Chat":
         st.markdown("---")
         st.markdown("""
         <div style='text-align: center; color: #8F8FA3;'> <p>Powered by Google Gemini 2.0 Flash 🤖</p>
             <p><small>Tip: Write clearly or upload high-quality images for best results!</small></p>
         </div>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        """, unsafe_allow_html=True)
+
+    session_store.sync(username, st.session_state)
+
+# --- Rerun profile overlay (admins) ---
+if profile_run.enabled and fun.is_admin():
+    profile_run.mark("profile overlay")
+    with st.expander(f"⏱️ Rerun profile: {profile_run.elapsed_ms():.0f} ms so far"):
+        st.caption("This rerun")
+        st.dataframe([{'section': name, 'ms': ms} for name, ms in profile_run.sections],
+                     use_container_width=True, hide_index=True,
+                     column_config={'ms': st.column_config.NumberColumn(format="%.1f")})
+        st.caption(f"All sessions: last {profiler.SAMPLES} reruns per section "
+                   f"({profiler.stats['runs']} profiled, {profiler.stats['dropped']} cut short)")
+        st.dataframe(profiler.report(), use_container_width=True, hide_index=True,
+                     column_config={'share': st.column_config.NumberColumn(format="percent"),
+                                    **{c: st.column_config.NumberColumn(format="%.1f")
+                                       for c in ('p50 ms', 'p95 ms', 'p99 ms', 'max ms')}})
+        dumps = profiler.slowest_dumps()
+        if dumps:
+            st.caption("Slowest reruns (cProfile): " + ", ".join(f"`{d}`" for d in dumps))
+        elif profiler.CPROFILE:
+            st.caption("No cProfile dumps yet.")
+profile_run.finish()
@@ -0,0 +1,352 @@
+import math
+import re
+import threading
+import time
+from fractions import Fraction
+
+# --- Local math engine ---
+# Handles the trivial traffic (the sidebar examples: "2 + 2", "15 × 3 + 20",
+# "x + 5 = 10") exactly and instantly. Anything it doesn't fully understand is
+# declined (returns None) and goes to Gemini as before.
+
+VARIABLE = 'x'
+MAX_LENGTH = 120
+MAX_DEGREE = 2
+
+_PREFIXES = ('what is', "what's", 'calculate', 'compute', 'evaluate', 'solve for x', 'solve', 'find x', 'simplify')
+_REPLACEMENTS = {'×': '*', '·': '*', '÷': '/', '−': '-', '–': '-', '²': '^2', '³': '^3', '**': '^', ':': '/'}
+_TOKEN = re.compile(r'\s*(?:(\d+\.\d*|\.\d+|\d+)|(x)|(.))')
+# something must be computed: a binary operator or an equation, not a bare reply like "7" or "-3"
+_OPERATION = re.compile(r'[\d.x)]\s*[-+*/^]|=')
+
+_lock = threading.Lock()
+stats = {'local': 0, 'declined': 0, 'local_seconds': 0.0}
+
+
+class Decline(Exception):
+    pass
+
+
+# --- Polynomials in x: {degree: Fraction} ---
+def _poly(const=0, degree=0):
+    return {degree: Fraction(const)} if const else {}
+
+
+def _clean(p):
+    return {d: c for d, c in p.items() if c != 0}
+
+
+def _add(a, b, sign=1):
+    out = dict(a)
+    for d, c in b.items():
+        out[d] = out.get(d, 0) + sign * c
+    return _clean(out)
+
+
+def _mul(a, b):
+    out = {}
+    for da, ca in a.items():
+        for db, cb in b.items():
+            out[da + db] = out.get(da + db, 0) + ca * cb
+    if out and max(out) > MAX_DEGREE:
+        raise Decline('degree too high')
+    return _clean(out)
+
+
+def _const(p):
+    if any(d != 0 for d in p):
+        return None
+    return p.get(0, Fraction(0))
+
+
+# --- Formatting ---
+def _exact(value):
+    if value.denominator == 1:
+        return str(value.numerator)
+    return f"{value.numerator}/{value.denominator}"
+
+
+def _operand(value):
+    # exact, bracketed when negative so "3 - (-2)" reads right
+    return f"({_exact(value)})" if value < 0 else _exact(value)
+
+
+def fmt(value):
+    # the final answer only: steps stay exact
+    if value.denominator == 1:
+        return _exact(value)
+    return f"{_exact(value)} ≈ {float(value):.6g}"
+
+
+def _fmt_poly(p):
+    if not p:
+        return '0'
+    terms = []
+    for d in sorted(p, reverse=True):
+        c = p[d]
+        mag = abs(c)
+        coef = '' if (mag == 1 and d) else (str(mag) if mag.denominator == 1 else f"({mag.numerator}/{mag.denominator})")
+        var = '' if d == 0 else (VARIABLE if d == 1 else f"{VARIABLE}²")
+        term = coef + var
+        if not terms:
+            terms.append(('-' if c < 0 else '') + term)
+        else:
+            terms.append(('- ' if c < 0 else '+ ') + term)
+    return ' '.join(terms)
+
+
+# --- Parser: expr := term (('+'|'-') term)*, term := factor (('*'|'/'|implicit) factor)*,
+#     factor := ('-'|'+') factor | power, power := atom ('^' factor)?, atom := number | x | '(' expr ')'
+class _Parser:
+    def __init__(self, text, steps):
+        self.tokens = []
+        for num, var, op in _TOKEN.findall(text):
+            if num:
+                self.tokens.append(('num', Fraction(num)))
+            elif var:
+                self.tokens.append(('var', var))
+            elif op.strip():
+                if op not in '+-*/^()':
+                    raise Decline(f'unsupported symbol {op!r}')
+                self.tokens.append(('op', op))
+        self.pos = 0
+        self.steps = steps
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, tok = self.peek()
+        if kind is None or (value is not None and tok != value):
+            raise Decline('unexpected end' if kind is None else f'unexpected {tok!r}')
+        self.pos += 1
+        return kind, tok
+
+    def parse(self):
+        if not self.tokens:
+            raise Decline('empty')
+        value = self.expr()
+        if self.pos != len(self.tokens):
+            raise Decline('trailing input')
+        return value
+
+    def _record(self, a, op, b, result):
+        ca, cb = _const(a), _const(b)
+        if ca is not None and cb is not None:
+            self.steps.append(f"{_operand(ca)} {op} {_operand(cb)} = {_exact(result.get(0, Fraction(0)))}")
+
+    def expr(self):
+        value = self.term()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            _, op = self.take()
+            rhs = self.term()
+            result = _add(value, rhs, 1 if op == '+' else -1)
+            self._record(value, op, rhs, result)
+            value = result
+        return value
+
+    def term(self):
+        value = self.factor()
+        while True:
+            kind, tok = self.peek()
+            if (kind, tok) in (('op', '*'), ('op', '/')):
+                self.take()
+                op = tok
+            elif kind == 'var' or (kind, tok) == ('op', '('):
+                op = '*'  # implicit multiplication: 2x, 3(x + 1); two numbers in a row ('2 3', '10 000') are not
+            else:
+                return value
+            rhs = self.factor()
+            if op == '/':
+                divisor = _const(rhs)
+                if divisor is None:
+                    raise Decline('division by an expression in x')
+                if divisor == 0:
+                    raise Decline('division by zero')
+                result = _mul(value, _poly(1 / divisor))
+                self._record(value, '÷', rhs, result)
+            else:
+                result = _mul(value, rhs)
+                self._record(value, '×', rhs, result)
+            value = result
+
+    def factor(self):
+        if self.peek() in (('op', '-'), ('op', '+')):
+            _, op = self.take()
+            value = self.factor()
+            return _mul(value, _poly(-1)) if op == '-' else value
+        return self.power()
+
+    def power(self):
+        base = self.atom()
+        if self.peek() != ('op', '^'):
+            return base
+        self.take()
+        exponent = _const(self.factor())
+        if exponent is None or exponent.denominator != 1 or abs(exponent) > 64:
+            raise Decline('unsupported exponent')
+        n = exponent.numerator
+        b = _const(base)
+        if b is not None:
+            if b == 0 and n < 0:
+                raise Decline('division by zero')
+            result = _poly(b ** n)
+            base_shown = _exact(b) if b >= 0 and b.denominator == 1 else f"({_exact(b)})"
+            self.steps.append(f"{base_shown}^{n} = {_exact(b ** n)}")
+            return result
+        if n < 0:
+            raise Decline('negative power of x')
+        result = _poly(1)
+        for _ in range(n):
+            result = _mul(result, base)
+        return result
+
+    def atom(self):
+        kind, tok = self.take()
+        if kind == 'num':
+            return _poly(tok)
+        if kind == 'var':
+            return {1: Fraction(1)}
+        if tok == '(':
+            value = self.expr()
+            self.take(')')
+            return value
+        raise Decline(f'unexpected {tok!r}')
+
+
+def _normalize(text):
+    text = text.strip().lower().rstrip('?.!').strip()
+    for prefix in _PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):].lstrip(' :')
+            break
+    for old, new in _REPLACEMENTS.items():
+        text = text.replace(old, new)
+    return text
+
+
+def _sqrt_fraction(value):
+    # exact square root of a non-negative Fraction, or None
+    n, d = math.isqrt(value.numerator), math.isqrt(value.denominator)
+    if n * n == value.numerator and d * d == value.denominator:
+        return Fraction(n, d)
+    return None
+
+
+def _solve_equation(lhs_text, rhs_text, shown):
+    steps = []
+    lhs = _Parser(lhs_text, steps).parse()
+    rhs = _Parser(rhs_text, steps).parse()
+    p = _add(lhs, rhs, -1)
+    degree = max(p) if p else 0
+    if degree == 0:
+        raise Decline('no variable')
+    lines = [f"**Expression/Problem:** {shown}", "", "**Solution:**"]
+    lines.append(f"1. Move every term to the left-hand side: ${_fmt_poly(p)} = 0$")
+    a, b, c = p.get(2, Fraction(0)), p.get(1, Fraction(0)), p.get(0, Fraction(0))
+    if degree == 1:
+        root = -c / b
+        if b == 1:
+            lines.append(f"2. Isolate {VARIABLE}: ${VARIABLE} = {_exact(root)}$")
+        else:
+            lines.append(f"2. Isolate {VARIABLE}: ${VARIABLE} = {_exact(-c)} / {_operand(b)}$")
+            lines.append(f"3. Simplify: ${VARIABLE} = {_exact(root)}$")
+        lines += ["", f"**Answer:** {VARIABLE} = {fmt(root)}"]
+        return '\n'.join(lines)
+
+    disc = b * b - 4 * a * c
+    lines.append(f"2. Identify the coefficients: a = {_exact(a)}, b = {_exact(b)}, c = {_exact(c)}")
+    lines.append(f"3. Discriminant: b² − 4ac = {_exact(disc)}")
+    if disc < 0:
+        lines.append("4. The discriminant is negative, so there are no real solutions.")
+        re_part = -b / (2 * a)
+        im_part = math.sqrt(-disc) / abs(2 * a)
+        lines += ["", f"**Answer:** no real solutions (complex roots {float(re_part):.6g} ± {im_part:.6g}i)"]
+        return '\n'.join(lines)
+    root_disc = _sqrt_fraction(disc)
+    lines.append(f"4. Quadratic formula: {VARIABLE} = (−b ± √(b² − 4ac)) / 2a")
+    if root_disc is not None:
+        roots = sorted({(-b - root_disc) / (2 * a), (-b + root_disc) / (2 * a)})
+        answer = ', '.join(f"{VARIABLE} = {fmt(r)}" for r in roots)
+    else:
+        center, spread = float(-b / (2 * a)), math.sqrt(disc) / abs(float(2 * a))
+        answer = (f"{VARIABLE} = ({_exact(-b)} ± √{_exact(disc)}) / {_exact(2 * a)}"
+                  f" ≈ {center - spread:.6g}, {center + spread:.6g}")
+    lines += ["", f"**Answer:** {answer}"]
+    return '\n'.join(lines)
+
+
+def _evaluate(text, shown):
+    steps = []
+    value = _const(_Parser(text, steps).parse())
+    if value is None:
+        raise Decline('expression in x without an equation')
+    lines = [f"**Expression/Problem:** {shown}", "", "**Solution:**"]
+    if steps:
+        lines += [f"{i}. {step}" for i, step in enumerate(steps, 1)]
+    else:
+        lines.append(f"1. The expression is already a number: {_exact(value)}")
+    lines += ["", f"**Answer:** {fmt(value)}"]
+    return '\n'.join(lines)
+
+
+def _analyze(text):
+    # -> (kind, markdown); raises Decline
+    if not text or len(text) > MAX_LENGTH:
+        raise Decline('length')
+    normalized = _normalize(text)
+    if not re.fullmatch(r'[\d\s.x+\-*/^()=]+', normalized):
+        raise Decline('not a bare expression')
+    if not _OPERATION.search(normalized):
+        raise Decline('nothing to compute')
+    shown = text.strip()
+    if normalized.count('=') == 1:
+        lhs, rhs = normalized.split('=')
+        answer = _solve_equation(lhs, rhs, shown)
+        kind = 'quadratic' if 'Discriminant' in answer else 'linear'
+        return kind, answer
+    if '=' in normalized:
+        raise Decline('several equals signs')
+    return 'arithmetic', _evaluate(normalized, shown)
+
+
+def solve(text):
+    """Markdown answer for a plain arithmetic expression or a linear/quadratic equation in x, else None."""
+    start = time.perf_counter()
+    try:
+        _, answer = _analyze(text)
+    except (Decline, ZeroDivisionError, OverflowError, ValueError):
+        answer = None
+    elapsed = time.perf_counter() - start
+    with _lock:
+        if answer is None:
+            stats['declined'] += 1
+        else:
+            stats['local'] += 1
+            stats['local_seconds'] += elapsed
+    return answer
+
+
+_CLASSIFICATION = {
+    'arithmetic': {'difficulty': 'Easy', 'required_concepts': ['Arithmetic', 'Order of operations']},
+    'linear': {'difficulty': 'Easy', 'required_concepts': ['Linear equations', 'Inverse operations']},
+    'quadratic': {'difficulty': 'Medium', 'required_concepts': ['Quadratic equations', 'Discriminant', 'Quadratic formula']},
+}
+
+
+def classify(text):
+    """{difficulty, required_concepts} for problems the engine can solve itself, else None."""
+    try:
+        kind, _ = _analyze(text)
+    except (Decline, ZeroDivisionError, OverflowError, ValueError):
+        return None
+    return dict(_CLASSIFICATION[kind])
+
+
+def hit_rate():
+    total = stats['local'] + stats['declined']
+    return stats['local'] / total if total else 0.0
+
+
+def mean_latency_ms():
+    return 1000 * stats['local_seconds'] / stats['local'] if stats['local'] else 0.0
@@ -0,0 +1,154 @@
+import io
+import sys
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# --- Canvas preprocessing before upload ---
+# st_canvas hands back a full-frame RGBA array that is mostly background. We find the
+# ink, crop to it (plus a margin), shrink to a target long edge and send a compact
+# grayscale / 1-bit image instead of the whole frame.
+
+TARGET_LONG_EDGE = 768
+MARGIN = 24
+INK_TOLERANCE = 40  # summed |RGB| distance from the background that counts as ink
+UPLOAD_LONG_EDGE = 1600  # the copy kept for the model
+THUMB_LONG_EDGE = 480  # the copy sent to the browser
+MAX_SOURCE_PIXELS = 64_000_000  # refuse anything bigger before decoding it
+
+
+def hex_to_rgb(color):
+    color = color.lstrip('#')
+    if len(color) == 3:
+        color = ''.join(c * 2 for c in color)
+    return np.array([int(color[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.int16)
+
+
+def ink_strength(rgba, bg_color='#FFFFFF'):
+    # 0..1 per pixel: how far the composited pixel is from the background
+    rgba = np.asarray(rgba)
+    rgb = rgba[..., :3].astype(np.int16)
+    alpha = rgba[..., 3].astype(np.float32) / 255.0 if rgba.shape[-1] == 4 else 1.0
+    distance = np.abs(rgb - hex_to_rgb(bg_color)).sum(axis=-1).astype(np.float32)
+    strength = np.clip(distance / 255.0, 0.0, 1.0) * alpha
+    strength[distance * alpha < INK_TOLERANCE] = 0.0
+    return strength
+
+
+def ink_bbox(strength):
+    rows = np.flatnonzero(strength.any(axis=1))
+    cols = np.flatnonzero(strength.any(axis=0))
+    if rows.size == 0:
+        return None
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def prepare_canvas(rgba, bg_color='#FFFFFF', long_edge=TARGET_LONG_EDGE, margin=MARGIN, bilevel=False):
+    """Return a cropped, downscaled dark-on-white image, or None for a blank canvas."""
+    if rgba is None:
+        return None
+    strength = ink_strength(rgba, bg_color)
+    box = ink_bbox(strength)
+    if box is None:
+        return None
+    top, bottom, left, right = box
+    h, w = strength.shape
+    top, left = max(top - margin, 0), max(left - margin, 0)
+    bottom, right = min(bottom + margin, h), min(right + margin, w)
+
+    gray = (255.0 * (1.0 - strength[top:bottom, left:right])).astype(np.uint8)
+    img = Image.fromarray(gray, 'L')
+    scale = long_edge / max(img.size)
+    if scale < 1.0:
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.BOX)
+    if bilevel:
+        img = img.point(lambda v: 255 if v > 160 else 0).convert('1')
+    return img
+
+
+# --- Uploads: decode small, never hold the full-resolution frame ---
+class TooLarge(ValueError):
+    pass
+
+
+def decode_upload(data, long_edge=UPLOAD_LONG_EDGE, max_pixels=MAX_SOURCE_PIXELS):
+    """Model-sized, upright RGB copy of an uploaded image.
+
+    Only the header is read before the pixel budget is checked; JPEGs are then decoded
+    straight at 1/2, 1/4 or 1/8 scale (draft mode) so a 48 MP photo never exists at
+    full size in memory.
+    """
+    img = Image.open(io.BytesIO(data))
+    if img.width * img.height > max_pixels:
+        raise TooLarge(f"image is {img.width}x{img.height}; the limit is {max_pixels // 1_000_000} MP")
+    if img.format == 'JPEG':
+        scale = min(1.0, long_edge / max(img.size))
+        img.draft('RGB', (round(img.width * scale), round(img.height * scale)))
+    img.thumbnail((long_edge, long_edge), Image.LANCZOS)
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        flat = Image.new('RGB', img.size, (255, 255, 255))
+        flat.paste(img, mask=img.split()[3])
+        return flat
+    return img.convert('RGB')
+
+
+def thumbnail_jpeg(img, long_edge=THUMB_LONG_EDGE, quality=80):
+    small = img.copy()
+    small.thumbnail((long_edge, long_edge), Image.LANCZOS)
+    out = io.BytesIO()
+    small.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+
+# --- Peak RSS per upload: python main/preprocess.py [megapixels] ---
+def _peak_rss_mb():
+    # VmHWM starts fresh in each exec'd child (ru_maxrss would inherit the parent's peak)
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _bench_child(path, how):
+    with open(path, 'rb') as f:
+        data = f.read()
+    before = _peak_rss_mb()
+    if how == 'naive':
+        # what Upload mode used to do: full decode for display, then a full RGB copy for the model
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        rgb = img.convert('RGB')
+        size = rgb.size
+    else:
+        rgb = decode_upload(data)
+        thumbnail_jpeg(rgb)
+        size = rgb.size
+    print(f"{how:>8}: kept {size[0]}x{size[1]}, peak RSS {_peak_rss_mb():.0f} MB (before decoding {before:.0f} MB)")
+
+
+if __name__ == '__main__':
+    import os
+    import subprocess
+    import tempfile
+
+    if len(sys.argv) == 3 and sys.argv[1] in ('naive', 'bounded'):
+        _bench_child(sys.argv[2], sys.argv[1])
+        sys.exit()
+    megapixels = float(sys.argv[1]) if len(sys.argv) > 1 else 48
+    w = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    h = int(w * 3 / 4)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'photo.jpg')
+        noise = np.random.default_rng(0).integers(0, 255, (h // 8, w // 8, 3), dtype=np.uint8)
+        Image.fromarray(noise).resize((w, h)).save(path, 'JPEG', quality=90)
+        print(f"{w}x{h} JPEG, {os.path.getsize(path) / 1e6:.1f} MB on disk")
+        for how in ('naive', 'bounded'):
+            # separate processes so each peak is measured from a clean start
+            subprocess.run([sys.executable, __file__, how, path], check=True)
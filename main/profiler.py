@@ -0,0 +1,153 @@
+import cProfile
+import os
+import threading
+import time
+from collections import deque
+
+# --- Per-rerun section profiler ---
+# Streamlit executes the whole of main2.py on every interaction. With profiling on
+# (PROFILE_RERUNS=1, or an admin's sidebar toggle) each rerun is split into named
+# sections by mark() checkpoints: a mark closes the running section and opens the
+# next, so the script needs no extra nesting. Section times from every session are
+# pooled into rolling windows for percentiles. With PROFILE_CPROFILE=1 profiled reruns
+# also run under cProfile and the slowest few are kept as .prof files.
+# A run cut short by st.rerun() never reaches finish(); the next run closes it.
+
+ENABLED = os.environ.get('PROFILE_RERUNS', '0') == '1'
+CPROFILE = os.environ.get('PROFILE_CPROFILE', '0') == '1'
+DUMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.profiles')
+SAMPLES = 500  # per section
+KEEP_SLOWEST = 5
+STALE_SECONDS = 2.0  # an unfinished run older than this ended in st.stop or a closed tab, not st.rerun()
+TOTAL = 'whole rerun'
+
+_lock = threading.Lock()
+_samples = {}  # section -> deque of ms, in first-seen order
+_slowest = []  # [(total ms, path)] of the kept cProfile dumps
+stats = {'runs': 0, 'dropped': 0, 'dumps': 0}
+
+
+class Run:
+    enabled = True
+
+    def __init__(self, cprofile=False):
+        self.started = self.last = time.perf_counter()
+        self.section = None
+        self.sections = []  # [(name, ms)] closed so far
+        self.finished = False
+        self.profile = None
+        if cprofile:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                self.profile = profile
+            except ValueError:
+                pass  # another profiler is already active (Python 3.12+ allows one per process)
+
+    def mark(self, name):
+        now = time.perf_counter()
+        if self.section is not None:
+            self.sections.append((self.section, 1000 * (now - self.last)))
+        self.section, self.last = name, now
+
+    def elapsed_ms(self):
+        return 1000 * (time.perf_counter() - self.started)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        if self.profile is not None:
+            self.profile.disable()
+        self.mark(None)
+        _record(self)
+
+    def abandon(self):
+        self.finished = True
+        if self.profile is not None:
+            self.profile.disable()
+        with _lock:
+            stats['dropped'] += 1
+
+
+class _Off:
+    enabled = False
+    sections = []
+
+    def mark(self, name):
+        pass
+
+    def finish(self):
+        pass
+
+
+_OFF = _Off()
+
+
+def begin(session_state, enabled):
+    """Start timing this rerun; returns a no-op run when profiling is off."""
+    previous = session_state.get('_profile_run')
+    if previous is not None and not previous.finished:
+        if time.perf_counter() - previous.last <= STALE_SECONDS:
+            previous.finish()  # ended in st.rerun(); its last section ran until now
+        else:
+            previous.abandon()
+    run = Run(CPROFILE) if enabled else None
+    session_state['_profile_run'] = run
+    return run or _OFF
+
+
+def _record(run):
+    total = sum(ms for _, ms in run.sections)
+    with _lock:
+        stats['runs'] += 1
+        for name, ms in [(TOTAL, total)] + run.sections:
+            window = _samples.get(name)
+            if window is None:
+                window = _samples[name] = deque(maxlen=SAMPLES)
+            window.append(ms)
+        if run.profile is not None and (len(_slowest) < KEEP_SLOWEST or total > _slowest[0][0]):
+            _dump(run.profile, total)
+
+
+def _dump(profile, total):
+    # caller holds _lock; keeps the KEEP_SLOWEST slowest reruns on disk
+    try:
+        os.makedirs(DUMP_DIR, exist_ok=True)
+        path = os.path.join(DUMP_DIR, f"rerun-{total:08.0f}ms-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof")
+        profile.dump_stats(path)
+    except OSError:
+        return
+    stats['dumps'] += 1
+    _slowest.append((total, path))
+    _slowest.sort()
+    while len(_slowest) > KEEP_SLOWEST:
+        _, evicted = _slowest.pop(0)
+        try:
+            os.remove(evicted)
+        except OSError:
+            pass
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] if values else 0.0
+
+
+def report():
+    """Percentiles per section over the last SAMPLES reruns of every session, whole rerun first."""
+    with _lock:
+        windows = [(name, list(window)) for name, window in _samples.items()]
+    mean_total = next((sum(v) / len(v) for name, v in windows if name == TOTAL), 0.0)
+    rows = []
+    for name, values in windows:
+        mean = sum(values) / len(values)
+        rows.append({'section': name, 'runs': len(values), 'p50 ms': percentile(values, 0.5),
+                     'p95 ms': percentile(values, 0.95), 'p99 ms': percentile(values, 0.99), 'max ms': max(values),
+                     'share': mean / mean_total if mean_total else 0.0})
+    return rows
+
+
+def slowest_dumps():
+    with _lock:
+        return [path for _, path in reversed(_slowest)]
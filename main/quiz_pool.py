@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+import gemini
+import jsonstream
+import ratelimit
+
+# --- Prefetched quiz pool ---
+# There are only TOPICS x DIFFICULTIES distinct quizzes to ask for, so a background
+# worker keeps a few validated quizzes ready for each pair and "Start Quiz" is served
+# from memory. The worker is the lowest-priority caller of the shared limiter: it uses
+# at most POOL_SHARE of the configured RPM, and only asks when nobody is queued and
+# at least MIN_HEADROOM of the request budget is free, so interactive solves go first.
+
+TOPICS = ["Algebra", "Calculus", "Geometry", "Trigonometry"]
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+TARGET_DEPTH = 2  # ready quizzes per (topic, difficulty)
+POOL_SHARE = 0.2  # of ratelimit.RPM
+MIN_INTERVAL = 60.0 / max(ratelimit.RPM * POOL_SHARE, 0.1)  # seconds between background requests (20 s at 15 RPM)
+MIN_HEADROOM = 0.5  # of the limiter's request bucket
+HEADROOM_POLL = 2.0  # seconds between headroom checks while the limiter is busy
+MAX_BACKOFF = 300.0
+MAX_SEEN = 500  # remembered question fingerprints per user
+
+QUIZ_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "question": {"type": "STRING"},
+            "options": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "answer": {"type": "STRING"},
+        },
+        "required": ["question", "options", "answer"],
+    },
+}
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": QUIZ_SCHEMA}
+
+log = logging.getLogger(__name__)
+
+_cond = threading.Condition()
+_pool = {(t, d): deque() for t in TOPICS for d in DIFFICULTIES}
+_wanted = deque()  # pairs a user asked for while empty; refilled first
+_seen = {}  # username -> deque of question fingerprints, oldest first
+_worker = None
+stats = {'served': 0, 'misses': 0, 'generated': 0, 'rejected': 0, 'errors': 0, 'refill_seconds': 0.0}
+
+
+def quiz_prompt(topic, difficulty):
+    return f"""You are a quiz generator. Create a 5-question multiple-choice quiz about {topic} at a {difficulty} level. Return the quiz as a valid JSON list. Each object must have keys: "question", "options" (a list of 4 strings), and "answer" (the correct option string). Do not include any text before or after the JSON list."""
+
+
+def validate_quiz(questions):
+    """The quiz page indexes q['question'], q['options'] and q['answer']; make sure they are all there."""
+    if not isinstance(questions, list) or not questions:
+        return False
+    for q in questions:
+        if not isinstance(q, dict):
+            return False
+        options = q.get('options')
+        if not isinstance(q.get('question'), str) or not isinstance(options, list) or len(options) != 4:
+            return False
+        if not all(isinstance(o, str) for o in options) or q.get('answer') not in options:
+            return False
+    return True
+
+
+_LABEL = re.compile(r"^\(?([A-Da-d])[).:]\s+|^\(([A-Da-d])\)\s*")
+_LETTER = re.compile(r"^\(?([A-Da-d])\)?[.:]?$")
+
+
+def _body(text):
+    # "B) 13" -> "13"; the option text without its letter label
+    return _LABEL.sub('', text.strip()).strip().lower()
+
+
+def _same_value(a, b):
+    try:
+        return float(a.replace(' ', '')) == float(b.replace(' ', ''))
+    except ValueError:
+        return False
+
+
+def fix_question(q):
+    """Repair near-miss questions locally: answer matching an option's content, or given as a letter or index.
+
+    Content comes first; math answers are often numbers, and "2" must pick the option "2.0" or "D) 2", not
+    the second option.
+    """
+    if not isinstance(q, dict) or not isinstance(q.get('options'), list):
+        return q
+    options = [str(o) for o in q['options']]
+    answer = str(q.get('answer', '')).strip()
+    if answer not in options:
+        folded = [o.strip().lower() for o in options]
+        bodies = [_body(o) for o in options]
+        wanted = _body(answer)
+        letter = _LETTER.match(answer)
+        if answer.lower() in folded:
+            answer = options[folded.index(answer.lower())]
+        elif wanted and wanted in bodies:
+            answer = options[bodies.index(wanted)]
+        elif wanted and any(_same_value(wanted, body) for body in bodies):
+            answer = next(o for o, body in zip(options, bodies) if _same_value(wanted, body))
+        elif letter and ord(letter.group(1).upper()) - 65 < len(options):
+            answer = options[ord(letter.group(1).upper()) - 65]
+        elif answer.isdigit() and 1 <= int(answer) <= len(options):
+            answer = options[int(answer) - 1]
+    return dict(q, options=options, answer=answer)
+
+
+def parse_quiz(text):
+    """Parse (and locally repair) a generated quiz; None if it is still unusable."""
+    questions = jsonstream.loads(text)
+    if isinstance(questions, dict):
+        questions = questions.get('questions', questions.get('quiz'))
+    if not isinstance(questions, list):
+        return None
+    questions = [fix_question(q) for q in questions]
+    return questions if validate_quiz(questions) else None
+
+
+def generate(api_key, topic, difficulty):
+    """One validated quiz straight from Gemini; raises ValueError if it can't be repaired."""
+    model = gemini.get_model(api_key, generation_config=GENERATION_CONFIG)
+    questions = parse_quiz(gemini.generate(model, quiz_prompt(topic, difficulty), mode='quiz').text)
+    if questions is None:
+        raise ValueError("The generated quiz was incomplete. Please try again.")
+    return questions
+
+
+def _fingerprint(question):
+    return hashlib.sha1(' '.join(question['question'].lower().split()).encode('utf-8')).hexdigest()[:16]
+
+
+def mark_seen(username, questions):
+    with _cond:
+        seen = _seen.setdefault(username, deque(maxlen=MAX_SEEN))
+        seen.extend(_fingerprint(q) for q in questions)
+
+
+def take(topic, difficulty, username):
+    """Pop a ready quiz this user hasn't seen (no repeated questions), or None."""
+    with _cond:
+        seen = set(_seen.get(username, ()))
+        pool = _pool[(topic, difficulty)]
+        for quiz in list(pool):
+            if not any(_fingerprint(q) in seen for q in quiz):
+                pool.remove(quiz)
+                stats['served'] += 1
+                _cond.notify()
+                break
+        else:
+            stats['misses'] += 1
+            if (topic, difficulty) not in _wanted:
+                _wanted.append((topic, difficulty))
+            _cond.notify()
+            return None
+    mark_seen(username, quiz)
+    return quiz
+
+
+def depth():
+    with _cond:
+        return {pair: len(q) for pair, q in _pool.items()}
+
+
+def mean_refill_seconds():
+    return stats['refill_seconds'] / stats['generated'] if stats['generated'] else 0.0
+
+
+def _next_pair():
+    # caller holds _cond
+    while _wanted:
+        pair = _wanted.popleft()
+        if len(_pool[pair]) < TARGET_DEPTH:
+            return pair
+    pair = min(_pool, key=lambda p: len(_pool[p]))
+    return pair if len(_pool[pair]) < TARGET_DEPTH else None
+
+
+def _run(api_key):
+    backoff = MIN_INTERVAL
+    while True:
+        with _cond:
+            pair = _next_pair()
+            while pair is None:
+                _cond.wait()
+                pair = _next_pair()
+        while ratelimit.limiter.headroom() < MIN_HEADROOM:
+            time.sleep(HEADROOM_POLL)  # interactive calls are using the quota; yield to them
+        start = time.perf_counter()
+        try:
+            questions = generate(api_key, *pair)
+        except ValueError:
+            questions = None
+        except Exception as e:
+            stats['errors'] += 1
+            log.warning("quiz pool refill for %s failed: %s", pair, e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+            continue
+        backoff = MIN_INTERVAL
+        with _cond:
+            if questions is None:
+                stats['rejected'] += 1
+            else:
+                _pool[pair].append(questions)
+                stats['generated'] += 1
+                stats['refill_seconds'] += time.perf_counter() - start
+        time.sleep(MIN_INTERVAL)
+
+
+def ensure_started(api_key):
+    global _worker
+    with _cond:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, args=(api_key,), name='quiz-pool', daemon=True)
+            _worker.start()
@@ -0,0 +1,166 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from google.api_core import exceptions as api_exceptions
+
+# --- Quota-aware rate limiting for every Gemini call ---
+# One process-wide limiter: a request bucket (RPM) and a token bucket (TPM). Callers
+# queue in FIFO order and are delayed, not failed, during short bursts; only a wait
+# longer than MAX_QUEUE_SECONDS is refused. 429/5xx responses are retried with
+# jittered exponential backoff, honouring the server's retry delay, and a 429 pauses
+# the whole queue so other sessions don't pile onto an exhausted quota.
+
+RPM = int(os.environ.get('GEMINI_RPM', 15))
+TPM = int(os.environ.get('GEMINI_TPM', 1_000_000))
+MAX_QUEUE_SECONDS = float(os.environ.get('GEMINI_MAX_QUEUE_SECONDS', 30))
+MAX_ATTEMPTS = 4
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+IMAGE_TOKENS = 258  # Gemini's flat charge per image
+
+_RETRYABLE = (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests,
+              api_exceptions.ServiceUnavailable, api_exceptions.InternalServerError,
+              api_exceptions.DeadlineExceeded)
+_RETRY_HINT = re.compile(r'(?:retry in|retry_delay\s*\{\s*seconds:)\s*([\d.]+)', re.IGNORECASE)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class Limiter:
+    def __init__(self, rpm, tpm):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests, self.tokens = float(rpm), float(tpm)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiters = deque()
+        self.cond = threading.Condition()
+        self.stats = {'requests': 0, 'queued': 0, 'queue_seconds': 0.0, 'max_queue_seconds': 0.0,
+                      'throttled': 0, 'retries': 0, 'rejected': 0, 'failures': 0}
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+
+    def _delay(self, now, cost):
+        # seconds until the head of the queue could go
+        delay = max(self.blocked_until - now, 0.0)
+        if self.requests < 1:
+            delay = max(delay, (1 - self.requests) * 60.0 / self.rpm)
+        if self.tokens < cost:
+            delay = max(delay, (cost - self.tokens) * 60.0 / self.tpm)
+        return delay
+
+    def acquire(self, cost, timeout=MAX_QUEUE_SECONDS):
+        cost = min(cost, self.tpm)
+        start = time.monotonic()
+        me = object()
+        with self.cond:
+            self.waiters.append(me)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._delay(now, cost) if self.waiters[0] is me else None
+                    if delay == 0.0:
+                        self.requests -= 1
+                        self.tokens -= cost
+                        break
+                    remaining = start + timeout - now
+                    if remaining <= 0 or (delay is not None and delay > remaining):
+                        self.stats['rejected'] += 1
+                        raise QuotaExceeded(f"Gemini quota exhausted: request would wait more than {timeout:.0f}s")
+                    self.cond.wait(min(delay, remaining) if delay is not None else remaining)
+            finally:
+                self.waiters.remove(me)
+                self.cond.notify_all()
+            waited = time.monotonic() - start
+            self.stats['requests'] += 1
+            if waited > 0.001:
+                self.stats['queued'] += 1
+                self.stats['queue_seconds'] += waited
+                self.stats['max_queue_seconds'] = max(self.stats['max_queue_seconds'], waited)
+        return waited
+
+    def settle(self, estimated, actual):
+        # charge the real token count once the response reports it
+        with self.cond:
+            self.tokens -= actual - estimated
+
+    def headroom(self):
+        """Share of the request budget free right now; 0 while anyone is queued or a 429 pause is on."""
+        with self.cond:
+            now = time.monotonic()
+            if self.waiters or self.blocked_until > now:
+                return 0.0
+            self._refill(now)
+            return max(self.requests, 0.0) / self.rpm
+
+    def pause(self, seconds):
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.stats['throttled'] += 1
+
+
+limiter = Limiter(RPM, TPM)
+
+
+def estimate_tokens(contents):
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(c) for c in contents)
+    if isinstance(contents, str):
+        return len(contents) // 4 + 1
+    return IMAGE_TOKENS
+
+
+def _retry_delay(error, attempt):
+    match = _RETRY_HINT.search(str(error))
+    if match:
+        return float(match.group(1)) + random.uniform(0, 1)
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def _is_quota(error):
+    return isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)) or '429' in str(error)
+
+
+def _is_retryable(error):
+    return isinstance(error, _RETRYABLE) or '429' in str(error)
+
+
+def call(fn, contents, *args, queue_timeout=MAX_QUEUE_SECONDS, **kwargs):
+    """Run fn(contents, *args, **kwargs) (generate_content / send_message) under the limiter.
+
+    queue_timeout: how long this caller may wait for a slot; batch work that nobody watches
+    request by request (bulk classification) passes a longer one.
+    """
+    estimated = estimate_tokens(contents)
+    for attempt in range(MAX_ATTEMPTS):
+        limiter.acquire(estimated, queue_timeout)
+        try:
+            response = fn(contents, *args, **kwargs)
+        except Exception as e:
+            if not _is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                with limiter.cond:
+                    limiter.stats['failures'] += 1
+                if _is_quota(e):
+                    raise QuotaExceeded(f"Gemini quota exhausted after {MAX_ATTEMPTS} attempts: {e}") from e
+                raise  # 5xx and timeouts stay what they are; they aren't the user's quota
+            delay = _retry_delay(e, attempt)
+            if _is_quota(e):
+                limiter.pause(delay)
+            with limiter.cond:
+                limiter.stats['retries'] += 1
+            time.sleep(delay)
+            continue
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and not kwargs.get('stream') and getattr(usage, 'total_token_count', 0):
+            limiter.settle(estimated, usage.total_token_count)
+        return response
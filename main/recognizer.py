@@ -0,0 +1,422 @@
+import os
+import sys
+import threading
+import time
+import zipfile
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import mathengine
+
+# --- Offline handwritten expression recognizer ---
+# Draw mode: split the (preprocessed, dark-on-white) drawing into symbols with
+# connected components, classify each with a small NumPy MLP trained on synthetic
+# renders, and solve the expression with mathengine. Low confidence -> None, and
+# the caller falls back to Gemini. No network or GPU needed.
+# Anything outside this small vocabulary must go to Gemini rather than be misread:
+# a reject class is trained on other letters and symbols, and a layout check sends
+# dots, exponents and descenders (2.5, 8², y) to Gemini before the classifier is asked.
+# The model trains once per process in the background (warm_up); until it is ready
+# every drawing goes to Gemini.
+
+REJECT = '?'
+CLASSES = list('0123456789') + ['+', '-', '=', 'x', '÷', '/', '(', ')', REJECT]
+# letters and symbols the reject class learns; glyphs that look like a class (o, l, z, s, g, b, X, t...) are left
+# out so they don't blur the digits, the layout check catches most of them by size or baseline instead
+REJECT_GLYPHS = 'acdefhkmnprtuvwyACEFGHKLMNPRUVWY!?%*&#@<>[]{}²³√π∞∑∫θαβλ'
+GLYPH = 20  # features are GLYPH x GLYPH pixels + aspect ratio terms
+HIDDEN = 128
+MIN_CONFIDENCE = 0.80
+MIN_AREA = 12  # ink pixels; smaller components are specks unless merged into a symbol
+MAX_SYMBOLS = 40
+MIN_SIZE = 0.3  # of the median digit height; smaller symbols (dots, commas) go to Gemini
+MIN_DIGIT_HEIGHT = 0.75  # of the median digit height; shorter 'digits' are exponents or letters
+BASELINE_TOLERANCE = 0.2  # of the median digit height
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.recognizer_model.npz')
+
+_lock = threading.Lock()
+_train_lock = threading.Lock()
+_model = None
+_warming = None
+stats = {'local': 0, 'fallback': 0, 'local_seconds': 0.0}
+
+
+# --- Synthetic training data ---
+def _ellipse(cx, cy, rx, ry, start=0, stop=360, n=24):
+    t = np.radians(np.linspace(start, stop, n))
+    return list(zip(cx + rx * np.cos(t), cy + ry * np.sin(t)))
+
+
+# strokes in a unit box, x to the right, y down
+TEMPLATES = {
+    '0': [_ellipse(0.5, 0.5, 0.3, 0.45)],
+    '1': [[(0.35, 0.2), (0.5, 0.05), (0.5, 0.95)]],
+    '2': [[(0.2, 0.25), (0.35, 0.08), (0.6, 0.05), (0.78, 0.2), (0.75, 0.4), (0.2, 0.95), (0.85, 0.95)]],
+    '3': [[(0.2, 0.12), (0.5, 0.03), (0.78, 0.2), (0.7, 0.4), (0.45, 0.48), (0.75, 0.58), (0.82, 0.8),
+           (0.55, 0.97), (0.2, 0.88)]],
+    '4': [[(0.65, 0.95), (0.65, 0.05), (0.15, 0.65), (0.85, 0.65)]],
+    '5': [[(0.78, 0.05), (0.25, 0.05), (0.2, 0.45), (0.55, 0.4), (0.8, 0.6), (0.75, 0.88), (0.45, 0.97),
+           (0.18, 0.88)]],
+    '6': [[(0.7, 0.05), (0.35, 0.3), (0.2, 0.65), (0.3, 0.92), (0.6, 0.95), (0.78, 0.75), (0.65, 0.52),
+           (0.35, 0.55), (0.22, 0.7)]],
+    '7': [[(0.15, 0.05), (0.85, 0.05), (0.4, 0.95)]],
+    '8': [_ellipse(0.5, 0.27, 0.22, 0.22), _ellipse(0.5, 0.72, 0.28, 0.24)],
+    '9': [_ellipse(0.5, 0.3, 0.28, 0.25), [(0.78, 0.3), (0.7, 0.95)]],
+    '+': [[(0.5, 0.15), (0.5, 0.85)], [(0.15, 0.5), (0.85, 0.5)]],
+    '-': [[(0.1, 0.5), (0.9, 0.5)]],
+    '=': [[(0.1, 0.35), (0.9, 0.35)], [(0.1, 0.65), (0.9, 0.65)]],
+    'x': [[(0.15, 0.15), (0.85, 0.85)], [(0.85, 0.15), (0.15, 0.85)]],
+    '÷': [[(0.1, 0.5), (0.9, 0.5)], _ellipse(0.5, 0.2, 0.04, 0.04, n=8), _ellipse(0.5, 0.8, 0.04, 0.04, n=8)],
+    '/': [[(0.75, 0.05), (0.25, 0.95)]],
+    '(': [_ellipse(1.0, 0.5, 0.6, 0.5, 135, 225, 12)],
+    ')': [_ellipse(0.0, 0.5, 0.6, 0.5, -45, 45, 12)],
+}
+# glyphs the bundled fonts draw properly (no ×, ÷, − in the default font)
+FONT_CLASSES = set('0123456789+-=x/()')
+
+
+def _fonts():
+    fonts = []
+    for name in ('DejaVuSans.ttf', 'DejaVuSerif.ttf', 'DejaVuSansMono.ttf'):
+        try:
+            ImageFont.truetype(name, 20)
+        except OSError:
+            continue
+        fonts.append(lambda size, name=name: ImageFont.truetype(name, size))
+    fonts.append(lambda size: ImageFont.load_default(size=size))
+    return fonts
+
+
+def render_template(label, rng, size=64):
+    img = Image.new('L', (size, size), 0)
+    draw = ImageDraw.Draw(img)
+    angle = np.radians(rng.uniform(-8, 8))
+    shear = rng.uniform(-0.2, 0.2)
+    sx, sy = rng.uniform(0.75, 1.2), rng.uniform(0.85, 1.15)
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    width = int(rng.integers(2, 7))
+    for stroke in TEMPLATES[label]:
+        pts = np.asarray(stroke, dtype=np.float64) - 0.5
+        pts += rng.normal(0, 0.025, pts.shape)
+        pts[:, 0] = (pts[:, 0] + shear * pts[:, 1]) * sx
+        pts[:, 1] *= sy
+        pts = pts @ rot.T * (size * 0.7) + size / 2
+        xy = [tuple(p) for p in pts.tolist()]
+        if len(xy) == 1:
+            xy = xy * 2
+        draw.line(xy, fill=255, width=width, joint='curve')
+    return np.asarray(img) > 127
+
+
+def render_font(label, rng, fonts, size=64):
+    font = fonts[int(rng.integers(len(fonts)))](int(rng.integers(30, 48)))
+    img = Image.new('L', (size, size), 0)
+    ImageDraw.Draw(img).text((size // 4, size // 8), label, font=font, fill=255)
+    img = img.rotate(rng.uniform(-8, 8), resample=Image.BILINEAR)
+    return np.asarray(img) > 127
+
+
+# --- Features ---
+def features(mask):
+    """mask: 2-D bool array of one symbol's ink."""
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    crop = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1].astype(np.float32)
+    h, w = crop.shape
+    side = max(h, w)
+    square = np.zeros((side, side), dtype=np.float32)
+    top, left = (side - h) // 2, (side - w) // 2
+    square[top:top + h, left:left + w] = crop
+    small = np.asarray(Image.fromarray((square * 255).astype(np.uint8)).resize((GLYPH, GLYPH), Image.BOX),
+                       dtype=np.float32) / 255.0
+    aspect = np.log(w / h)
+    return np.concatenate([small.ravel(), [aspect / 2, float(aspect > 1.2), float(aspect < -1.2)]]).astype(np.float32)
+
+
+def synthetic_dataset(per_class=400, seed=0):
+    rng = np.random.default_rng(seed)
+    fonts = _fonts()
+    X, y = [], []
+    for ci, label in enumerate(CLASSES):
+        for i in range(per_class * 2 if label == REJECT else per_class):
+            if label == REJECT:
+                mask = render_font(REJECT_GLYPHS[int(rng.integers(len(REJECT_GLYPHS)))], rng, fonts)
+            elif label in FONT_CLASSES and i % 3 == 0:
+                mask = render_font(label, rng, fonts)
+            else:
+                mask = render_template(label, rng)
+            if not mask.any():
+                continue
+            X.append(features(mask))
+            y.append(ci)
+    return np.stack(X), np.asarray(y)
+
+
+# --- Model: one hidden layer MLP, trained with Adam ---
+def _forward(params, X):
+    h = np.maximum(X @ params['W1'] + params['b1'], 0)
+    logits = h @ params['W2'] + params['b2']
+    logits -= logits.max(axis=1, keepdims=True)
+    p = np.exp(logits)
+    return h, p / p.sum(axis=1, keepdims=True)
+
+
+def train(per_class=400, epochs=30, seed=0):
+    X, y = synthetic_dataset(per_class, seed)
+    rng = np.random.default_rng(seed + 1)
+    d, k = X.shape[1], len(CLASSES)
+    params = {
+        'W1': rng.normal(0, np.sqrt(2 / d), (d, HIDDEN)).astype(np.float32),
+        'b1': np.zeros(HIDDEN, np.float32),
+        'W2': rng.normal(0, np.sqrt(2 / HIDDEN), (HIDDEN, k)).astype(np.float32),
+        'b2': np.zeros(k, np.float32),
+    }
+    m = {n: np.zeros_like(v) for n, v in params.items()}
+    v = {n: np.zeros_like(p) for n, p in params.items()}
+    lr, beta1, beta2, step = 3e-3, 0.9, 0.999, 0
+    onehot = np.eye(k, dtype=np.float32)[y]
+    for _ in range(epochs):
+        order = rng.permutation(len(X))
+        for start in range(0, len(X), 128):
+            idx = order[start:start + 128]
+            xb, tb = X[idx], onehot[idx]
+            h, p = _forward(params, xb)
+            dlogits = (p - tb) / len(idx)
+            dh = (dlogits @ params['W2'].T) * (h > 0)
+            grads = {'W2': h.T @ dlogits, 'b2': dlogits.sum(0), 'W1': xb.T @ dh, 'b1': dh.sum(0)}
+            step += 1
+            for n, g in grads.items():
+                m[n] = beta1 * m[n] + (1 - beta1) * g
+                v[n] = beta2 * v[n] + (1 - beta2) * g * g
+                mhat, vhat = m[n] / (1 - beta1 ** step), v[n] / (1 - beta2 ** step)
+                params[n] -= lr * mhat / (np.sqrt(vhat) + 1e-8)
+    return params
+
+
+def load_model():
+    """The trained weights, loading or training them first if needed (seconds; see warm_up)."""
+    global _model
+    if _model is not None:
+        return _model
+    with _train_lock:
+        if _model is None:
+            try:
+                with np.load(MODEL_PATH) as data:
+                    params = {n: data[n] for n in ('W1', 'b1', 'W2', 'b2')}
+                if params['W2'].shape[1] != len(CLASSES):
+                    raise ValueError('class list changed')
+            except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+                params = train()
+                try:
+                    save_model(params)
+                except OSError:
+                    pass
+            _model = params
+    return _model
+
+
+def save_model(params, path=MODEL_PATH):
+    # temp file + rename: another process may be loading the model at the same time
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, **params)
+    os.replace(tmp, path)
+
+
+def warm_up():
+    """Load or train the model on a background thread, once per process."""
+    global _warming
+    with _lock:
+        if _warming is None and _model is None:
+            _warming = threading.Thread(target=load_model, name='recognizer-train', daemon=True)
+            _warming.start()
+
+
+# --- Segmentation ---
+def components(mask):
+    """Connected components (8-connected) via run-length union-find. Returns a list of (rows, cols) index arrays."""
+    parent = []
+
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    runs = []  # (row, start, stop, id)
+    prev = []
+    for r in range(mask.shape[0]):
+        row = np.concatenate([[0], mask[r].view(np.int8), [0]])
+        edges = np.flatnonzero(np.diff(row))
+        current = []
+        for start, stop in zip(edges[::2], edges[1::2]):
+            rid = len(parent)
+            parent.append(rid)
+            for pstart, pstop, pid in prev:
+                if pstart <= stop and start <= pstop:  # overlap incl. diagonal neighbours
+                    ra, rb = find(rid), find(pid)
+                    if ra != rb:
+                        parent[rb] = ra
+            current.append((start, stop, rid))
+            runs.append((r, start, stop, rid))
+        prev = current
+    groups = {}
+    for r, start, stop, rid in runs:
+        groups.setdefault(find(rid), []).append((r, start, stop))
+    return list(groups.values())
+
+
+def _bbox(runs):
+    rows = [r for r, _, _ in runs]
+    return min(rows), max(rows) + 1, min(s for _, s, _ in runs), max(e for _, _, e in runs)
+
+
+def segment(mask, with_boxes=False):
+    """Group components into symbols, left to right. Stacked parts ('=', '÷') are merged."""
+    boxes = [[_bbox(c), c] for c in components(mask)]
+    boxes.sort(key=lambda b: b[0][2])
+    symbols = []
+    for box, runs in boxes:
+        top, bottom, left, right = box
+        if symbols:
+            ptop, pbottom, pleft, pright = symbols[-1][0]
+            overlap = min(right, pright) - max(left, pleft)
+            if overlap > 0.5 * min(right - left, pright - pleft):
+                symbols[-1][0] = (min(top, ptop), max(bottom, pbottom), min(left, pleft), max(right, pright))
+                symbols[-1][1] = symbols[-1][1] + runs
+                continue
+        symbols.append([box, runs])
+    out, boxes = [], []
+    for (top, bottom, left, right), runs in symbols:
+        if sum(e - s for _, s, e in runs) < MIN_AREA:
+            continue
+        sub = np.zeros((bottom - top, right - left), dtype=bool)
+        for r, s, e in runs:
+            sub[r - top, s - left:e - left] = True
+        out.append(sub)
+        boxes.append((top, bottom, left, right))
+    return (boxes, out) if with_boxes else out
+
+
+# --- Recognition ---
+def _layout_ok(boxes, labels):
+    """False when a symbol's size or position doesn't fit a single line of full-size symbols."""
+    digits = [box for box, label in zip(boxes, labels) if label.isdigit()] or boxes
+    height = float(np.median([bottom - top for top, bottom, _, _ in digits]))
+    top_line = float(np.median([top for top, _, _, _ in digits]))
+    baseline = float(np.median([bottom for _, bottom, _, _ in digits]))
+    tolerance = BASELINE_TOLERANCE * height
+    for (top, bottom, left, right), label in zip(boxes, labels):
+        if max(bottom - top, right - left) < MIN_SIZE * height:
+            return False  # a dot or comma
+        if label.isdigit() and (bottom - top < MIN_DIGIT_HEIGHT * height or abs(bottom - baseline) > tolerance):
+            return False  # an exponent, or a letter like o / g
+        if label == 'x' and abs(bottom - baseline) > tolerance:
+            return False  # a y or another letter with a descender
+        if not top_line - tolerance <= (top + bottom) / 2 <= baseline + tolerance:
+            return False  # raised or lowered off the line
+    return True
+
+
+def recognize(image):
+    """image: PIL image, dark ink on a light background. Returns (expression, confidence) or (None, 0.0).
+
+    Also (None, 0.0) while the model is still training, and whenever a symbol is out of
+    vocabulary or off the line.
+    """
+    params = _model
+    if params is None:
+        warm_up()
+        return None, 0.0
+    mask = np.asarray(image.convert('L')) < 128
+    if not mask.any():
+        return None, 0.0
+    boxes, symbols = segment(mask, with_boxes=True)
+    if not symbols or len(symbols) > MAX_SYMBOLS:
+        return None, 0.0
+    _, probs = _forward(params, np.stack([features(s) for s in symbols]))
+    labels = [CLASSES[i] for i in probs.argmax(axis=1)]
+    if REJECT in labels or not _layout_ok(boxes, labels):
+        return None, 0.0
+    return ''.join(labels), float(probs.max(axis=1).min())
+
+
+def solve(image, min_confidence=MIN_CONFIDENCE):
+    """Markdown answer when the drawing is read confidently and mathengine can solve it, else None."""
+    start = time.perf_counter()
+    expression, confidence = recognize(image)
+    answer = None
+    if expression is not None and confidence >= min_confidence:
+        answer = mathengine.solve(expression)
+    with _lock:
+        if answer is None:
+            stats['fallback'] += 1
+        else:
+            stats['local'] += 1
+            stats['local_seconds'] += time.perf_counter() - start
+    if answer is None:
+        return None
+    return f"{answer}\n\n*Read offline as `{expression}` ({confidence:.0%} confidence).*"
+
+
+# --- Benchmark: python main/recognizer.py [train|bench] ---
+FIXTURES = ['2+2', '15÷3+20', 'x+5=10', '7-4', '9/3', '(2+3)-4', '3x-7=11', '12÷4', '8-5=x', '6/6',
+            '45+17', '100-1', '2x+1=9', '(8)/(2)', '31+69', '5-9', '4x=12', '0+7', '76-38', 'x-3=4']
+# typed on the canvas with a font; none of these may be answered offline
+TRAPS = ['2.5+1', '8²', '5!', 'log 8', 'x + y = 10', 'a+b=3', '√9']
+
+
+def render_fixture(text, rng, height=605, width=1200, bg=(0x1A, 0x1A, 0x3D), ink=(0x33, 0xE6, 0xF6)):
+    """Draw an expression the way a student would on the canvas: RGBA, ink over a coloured background."""
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    canvas[..., :3], canvas[..., 3] = bg, 255
+    x, glyph = 150, int(rng.integers(70, 110))
+    for ch in text:
+        mask = render_template(ch, rng, size=glyph)
+        rows, cols = np.nonzero(mask)
+        y0 = 250 + int(rng.integers(-8, 8))
+        canvas[y0 + rows, x + cols - cols.min(), :3] = ink
+        x += cols.max() - cols.min() + int(rng.integers(20, 40))
+    return canvas
+
+
+def render_typed(text, size=90, bg=(0x1A, 0x1A, 0x3D), ink=(0x33, 0xE6, 0xF6)):
+    img = Image.new('RGB', (1200, 605), bg)
+    ImageDraw.Draw(img).text((150, 250), text, font=_fonts()[0](size), fill=ink)
+    rgba = np.dstack([np.asarray(img), np.full((605, 1200), 255, np.uint8)])
+    return rgba
+
+
+def bench(seed=123):
+    import preprocess
+
+    rng = np.random.default_rng(seed)
+    load_model()
+    correct, answered, timings = 0, 0, []
+    for text in FIXTURES:
+        canvas = render_fixture(text, rng)
+        start = time.perf_counter()
+        image = preprocess.prepare_canvas(canvas, '#1A1A3D')
+        expression, confidence = recognize(image)
+        local = expression is not None and confidence >= MIN_CONFIDENCE and mathengine.solve(expression) is not None
+        timings.append(time.perf_counter() - start)
+        correct += expression == text
+        answered += local
+        print(f"{text:>10} -> {expression or '-':>10}  conf {confidence:.2f}  {'local' if local else 'gemini'}")
+    timings.sort()
+    n = len(FIXTURES)
+    print(f"accuracy {correct / n:.0%}  answered locally {answered / n:.0%}  "
+          f"p50 {1000 * timings[n // 2]:.1f} ms  p95 {1000 * timings[int(0.95 * (n - 1))]:.1f} ms")
+    for text in TRAPS:
+        answer = solve(preprocess.prepare_canvas(render_typed(text), '#1A1A3D'))
+        print(f"{text:>10} -> {'answered offline (wrong!)' if answer else 'gemini'}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'train':
+        start = time.perf_counter()
+        save_model(train())
+        print(f"trained in {time.perf_counter() - start:.1f}s -> {MODEL_PATH}")
+    else:
+        bench()
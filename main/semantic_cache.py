@@ -0,0 +1,124 @@
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# --- Semantic cache for first-turn chat questions ---
+# "what is a derivative" and "What's a derivative?" should cost one Gemini call, not
+# two. Questions are embedded locally as hashed character n-grams (l2-normalized, so
+# a dot product is cosine similarity) into a fixed-size NumPy matrix; a new question
+# reuses the stored answer of its nearest neighbour above THRESHOLD, provided both
+# have exactly the same math tokens (math_key). When the index is full the least
+# recently used entry is overwritten.
+
+DIM = 2 ** 11
+MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_ENTRIES', 1000))
+THRESHOLD = float(os.environ.get('CHAT_CACHE_THRESHOLD', 0.90))
+MAX_QUESTION_CHARS = 300
+
+_TOKEN = re.compile(r"\d+(?:\.\d+)?|[a-z]+|[^\sa-z0-9?.,;:!\"]")
+_CONTRACTION = re.compile(r"([a-z]{2,})'([a-z]+)")
+# words that change the question's math, not just its phrasing
+_MATH_WORDS = {'sin', 'cos', 'tan', 'cot', 'sec', 'csc', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh', 'tanh',
+               'log', 'ln', 'exp', 'sqrt', 'root', 'abs', 'lim', 'limit', 'derivative', 'differentiate',
+               'integral', 'integrate', 'sum', 'product', 'factorial', 'mod', 'gcd', 'lcm', 'square', 'cube',
+               'plus', 'minus', 'times', 'over', 'divided', 'squared', 'cubed', 'inverse', 'pi', 'infinity',
+               'first', 'second', 'third', 'partial', 'definite', 'indefinite', 'maximum', 'minimum', 'max', 'min'}
+_FILLER = {'a', 'an', 'the', 'what', 'is', 'are', 'how', 'do', 'does', 'i', 'to', 'can', 'you', 'me', 'please',
+           'explain', 'tell', 'about', 'mean', 'by'}
+_lock = threading.Lock()
+_vectors = np.zeros((MAX_ENTRIES, DIM), np.float32)
+_questions = [None] * MAX_ENTRIES
+_answers = [None] * MAX_ENTRIES
+_keys = [None] * MAX_ENTRIES
+_last_used = np.zeros(MAX_ENTRIES)
+_size = 0
+stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+
+def normalize(question):
+    words = re.sub(r"[?!.,]+(\s|$)", " ", question.lower().replace("'s", " is")).split()
+    return ' '.join(w for w in words if w not in _FILLER) or ' '.join(words)
+
+
+def embed(question):
+    text = f" {normalize(question)} "
+    grams = [text[i:i + n] for n in (3, 4, 5) for i in range(len(text) - n + 1)]
+    vector = np.zeros(DIM, np.float32)
+    if grams:
+        idx = np.fromiter((zlib.crc32(g.encode('utf-8')) % DIM for g in grams), dtype=np.int64, count=len(grams))
+        np.add.at(vector, idx, 1.0)
+        vector /= np.linalg.norm(vector)
+    return vector
+
+
+def math_key(question):
+    """Every math-bearing token in order: numbers, operators, function names and single-letter variables.
+
+    "solve 2x+3=7" / "solve 2x+5=7", "+ sin(x)" / "- cos(x)" and "with respect to x" / "... to y"
+    look alike as n-grams but need different answers; a cached answer is reused only on an exact key match.
+    """
+    tokens = _TOKEN.findall(_CONTRACTION.sub(r"\1\2", question.lower()))
+    key = []
+    for i, token in enumerate(tokens):
+        if len(token) == 1 and token in 'ai':
+            # the article / pronoun, unless it sits in a formula (a+b, 2i)
+            neighbours = tokens[max(i - 1, 0):i] + tokens[i + 1:i + 2]
+            if not any(not t.isalpha() for t in neighbours):
+                continue
+        if not token.isalpha() or len(token) == 1 or token in _MATH_WORDS:
+            key.append(token)
+    return tuple(key)
+
+
+def lookup(question, threshold=None):
+    """(answer, matched_question, similarity) for a close enough earlier question, else None."""
+    threshold = THRESHOLD if threshold is None else threshold
+    if len(question) > MAX_QUESTION_CHARS:
+        return None
+    vector = embed(question)
+    key = math_key(question)
+    with _lock:
+        if _size:
+            scores = _vectors[:_size] @ vector
+            for i in np.argsort(-scores)[:5]:
+                if scores[i] < threshold:
+                    break
+                if _keys[i] == key:
+                    _last_used[i] = time.monotonic()
+                    stats['hits'] += 1
+                    return _answers[i], _questions[i], float(scores[i])
+        stats['misses'] += 1
+    return None
+
+
+def store(question, answer):
+    global _size
+    if len(question) > MAX_QUESTION_CHARS or not answer:
+        return
+    vector = embed(question)
+    with _lock:
+        if _size and float((_vectors[:_size] @ vector).max()) > 0.999:
+            return  # already answered
+        if _size < MAX_ENTRIES:
+            i = _size
+            _size += 1
+        else:
+            i = int(_last_used.argmin())
+            stats['evictions'] += 1
+        _vectors[i] = vector
+        _questions[i], _answers[i], _keys[i] = question, answer, math_key(question)
+        _last_used[i] = time.monotonic()
+        stats['stores'] += 1
+
+
+def size():
+    return _size
+
+
+def hit_rate():
+    total = stats['hits'] + stats['misses']
+    return stats['hits'] / total if total else 0.0
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import chat_context
+
+# --- Durable per-user session state ---
+# Chat history, quiz progress and the last solution survive a refresh or a restart.
+# Each user has an append-only JSONL file of small change records; sync() compares the
+# session with what was last written and appends only the difference (new chat
+# messages, a new quiz answer, a changed solution), and restore() replays the file on
+# login. Files are compacted to a single snapshot on restore once they grow long.
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.sessions')
+COMPACT_AFTER = 500  # records
+
+_lock = threading.Lock()
+_SAFE = re.compile(r'[^a-z0-9_-]')
+
+
+def _path(username):
+    digest = hashlib.sha1(username.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(STORE_DIR, f"{_SAFE.sub('_', username.lower())[:32]}-{digest}.jsonl")
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+def _digest(value):
+    return hashlib.sha1(_dumps(value).encode('utf-8')).hexdigest()
+
+
+def _append(username, records):
+    if not records:
+        return
+    data = ''.join(_dumps(r) + '\n' for r in records)
+    with _lock:
+        os.makedirs(STORE_DIR, exist_ok=True)
+        with open(_path(username), 'a', encoding='utf-8') as f:
+            f.write(data)
+
+
+def _empty():
+    return {'messages': [], 'summary': '', 'summarized': 0, 'quiz_questions': [],
+            'current_question_index': 0, 'user_answers': [], 'quiz_started': False, 'solution_result': None}
+
+
+def load(username):
+    """(state, record count) replayed from the user's log."""
+    state, count = _empty(), 0
+    try:
+        with open(_path(username), encoding='utf-8') as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a torn last line from a crash
+                count += 1
+                kind = r.get('kind')
+                if kind == 'message':
+                    state['messages'].append({'role': r['role'], 'content': r['content']})
+                elif kind == 'messages_reset':
+                    state['messages'], state['summary'], state['summarized'] = [], '', 0
+                elif kind == 'summary':
+                    state['summary'], state['summarized'] = r['summary'], r['summarized']
+                elif kind == 'quiz':
+                    state['quiz_questions'] = r['questions']
+                elif kind == 'quiz_progress':
+                    state['current_question_index'] = r['index']
+                    state['user_answers'] = r['answers']
+                    state['quiz_started'] = r['started']
+                elif kind == 'solution':
+                    state['solution_result'] = r['text']
+                elif kind == 'snapshot':
+                    state = {**_empty(), **r['state']}
+    except OSError:
+        pass
+    return state, count
+
+
+def _compact(username, state):
+    path = _path(username)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with _lock:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(_dumps({'kind': 'snapshot', 'state': state}) + '\n')
+        os.replace(tmp, path)
+
+
+def _marks(session_state):
+    context = session_state.get('chat_context')
+    return {
+        'messages': len(session_state.get('messages') or []),
+        'first_message': _digest((session_state.get('messages') or [None])[0]),
+        'summary': (context.summary, context.summarized) if context is not None else ('', 0),
+        'quiz': _digest(session_state.get('quiz_questions') or []),
+        'quiz_progress': (session_state.get('current_question_index', 0), len(session_state.get('user_answers') or []),
+                          bool(session_state.get('quiz_started'))),
+        'solution': _digest(session_state.get('solution_result')),
+    }
+
+
+def restore(username, session_state):
+    """Load the user's saved state into the session; the chat session is rebuilt from stored turns, not replayed."""
+    state, count = load(username)
+    if count > COMPACT_AFTER:
+        _compact(username, state)
+    for key in ('messages', 'quiz_questions', 'current_question_index', 'user_answers', 'quiz_started',
+                'solution_result'):
+        session_state[key] = state[key]
+    context = chat_context.ChatContext()
+    for msg in state['messages']:
+        context.add(msg['role'], msg['content'])
+    context.summary, context.summarized = state['summary'], state['summarized']
+    context.folding = context.folding[context.summarized:]
+    session_state['chat_context'] = context
+    session_state['chat_session'] = None  # recreated on the next turn with the bounded history
+    session_state['_store_marks'] = _marks(session_state)
+
+
+def sync(username, session_state):
+    """Append whatever changed since the last sync."""
+    before = session_state.get('_store_marks')
+    after = _marks(session_state)
+    if before == after:
+        return
+    before = before or _marks({})
+    records = []
+    messages = session_state.get('messages') or []
+    if after['messages'] < before['messages'] or (before['messages'] and after['first_message'] != before['first_message']):
+        records.append({'kind': 'messages_reset'})
+        new_messages = messages
+    else:
+        new_messages = messages[before['messages']:]
+    records += [{'kind': 'message', 'role': m['role'], 'content': m['content']} for m in new_messages]
+    if after['summary'] != before['summary'] and after['summary'][0]:
+        records.append({'kind': 'summary', 'summary': after['summary'][0], 'summarized': after['summary'][1]})
+    if after['quiz'] != before['quiz']:
+        records.append({'kind': 'quiz', 'questions': session_state.get('quiz_questions') or []})
+    if after['quiz_progress'] != before['quiz_progress'] or after['quiz'] != before['quiz']:
+        records.append({'kind': 'quiz_progress', 'index': session_state.get('current_question_index', 0),
+                        'answers': list(session_state.get('user_answers') or []),
+                        'started': bool(session_state.get('quiz_started'))})
+    if after['solution'] != before['solution']:
+        records.append({'kind': 'solution', 'text': session_state.get('solution_result')})
+    try:
+        _append(username, records)
+    except OSError:
+        return  # try again next rerun
+    session_state['_store_marks'] = after
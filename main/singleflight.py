@@ -0,0 +1,115 @@
+import hashlib
+import threading
+
+# --- Single-flight request coalescing ---
+# Identical requests in flight at the same time (thirty students sending the same
+# worksheet problem, or a double-clicked Solve) share one upstream call. Keys are
+# built by the caller; see gemini.request_key.
+
+_lock = threading.Lock()
+_inflight = {}
+stats = {'leaders': 0, 'followers': 0}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def do(key, fn):
+    """Run fn() once per key among concurrent callers; everyone gets the same result or exception."""
+    with _lock:
+        call = _inflight.get(key)
+        leader = call is None
+        if leader:
+            call = _inflight[key] = _Call()
+            stats['leaders'] += 1
+        else:
+            stats['followers'] += 1
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+    try:
+        call.result = fn()
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _inflight[key]
+        call.done.set()
+    return call.result
+
+
+class _Broadcast:
+    """A stream read by one background thread and replayed to any number of consumers."""
+
+    def __init__(self, fn):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.cond = threading.Condition()
+        threading.Thread(target=self._pump, args=(fn,), name='singleflight-stream', daemon=True).start()
+
+    def _pump(self, fn):
+        try:
+            for chunk in fn():
+                with self.cond:
+                    self.chunks.append(chunk)
+                    self.cond.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            with self.cond:
+                self.finished = True
+                self.cond.notify_all()
+
+    def __iter__(self):
+        i = 0
+        while True:
+            with self.cond:
+                while i >= len(self.chunks) and not self.finished:
+                    self.cond.wait()
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            i += 1
+            yield chunk
+
+
+def stream(key, fn):
+    """Like do() for streaming calls: concurrent callers each iterate the same upstream chunks."""
+    with _lock:
+        broadcast = _inflight.get(key)
+        if broadcast is None:
+            broadcast = _inflight[key] = _Broadcast(fn)
+            stats['leaders'] += 1
+            threading.Thread(target=_forget_when_done, args=(key, broadcast), daemon=True).start()
+        else:
+            stats['followers'] += 1
+    return iter(broadcast)
+
+
+def _forget_when_done(key, broadcast):
+    with broadcast.cond:
+        while not broadcast.finished:
+            broadcast.cond.wait()
+    with _lock:
+        if _inflight.get(key) is broadcast:
+            del _inflight[key]
+
+
+def coalescing_ratio():
+    total = stats['leaders'] + stats['followers']
+    return stats['followers'] / total if total else 0.0
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# --- Content-addressed cache for image solves ---
+# Key = prompt version + exact digest of the normalized image, so a re-submitted
+# drawing or a re-upload of the same photo skips the Gemini round trip. Only exact
+# matches are served: an answer can hinge on one glyph (2+3 vs 2+8), which a
+# perceptual hash with a distance tolerance can't tell apart.
+# Tier 1 is an in-memory LRU bounded by bytes, tier 2 is one file per key on disk.
+
+MEMORY_BUDGET = 8 * 1024 * 1024
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.solution_cache')
+
+_lock = threading.Lock()
+_memory = OrderedDict()  # key -> answer text
+_memory_bytes = 0
+stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+
+def prompt_version(prompt):
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]
+
+
+def image_hash(rgb_img):
+    # every grayscale pixel at full size: any downscale can blur small text until two problems look the same
+    gray = rgb_img.convert('L')
+    return hashlib.sha1(f"{gray.size}".encode('ascii') + gray.tobytes()).hexdigest()
+
+
+def _disk_path(key):
+    return os.path.join(CACHE_DIR, key.replace(':', '_') + '.md')
+
+
+def _remember(key, text):
+    global _memory_bytes
+    if key in _memory:
+        _memory_bytes -= len(_memory.pop(key).encode('utf-8'))
+    _memory[key] = text
+    _memory_bytes += len(text.encode('utf-8'))
+    while _memory_bytes > MEMORY_BUDGET and len(_memory) > 1:
+        _, old = _memory.popitem(last=False)
+        _memory_bytes -= len(old.encode('utf-8'))
+        stats['evictions'] += 1
+
+
+def make_key(rgb_img, prompt):
+    return f"{prompt_version(prompt)}:{image_hash(rgb_img)}"
+
+
+def get(key):
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            stats['memory_hits'] += 1
+            return _memory[key]
+    try:
+        with open(_disk_path(key), encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        with _lock:
+            stats['misses'] += 1
+        return None
+    with _lock:
+        _remember(key, text)
+        stats['disk_hits'] += 1
+    return text
+
+
+def put(key, text):
+    with _lock:
+        _remember(key, text)
+        stats['stores'] += 1
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = _disk_path(key) + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp, _disk_path(key))
+    except OSError:
+        pass  # the disk tier is best effort; the memory tier still has it
+
+
+def hit_rate():
+    hits = stats['memory_hits'] + stats['disk_hits']
+    total = hits + stats['misses']
+    return hits / total if total else 0.0
+
+
+def memory_usage():
+    return len(_memory), _memory_bytes
+
+
+# --- Check: python main/solve_cache.py (problems one digit apart must not share a key) ---
+if __name__ == '__main__':
+    from PIL import ImageDraw, ImageFont
+
+    def render(text, size):
+        img = Image.new('RGB', (1600, 1200), 'white')
+        try:
+            font = ImageFont.truetype('DejaVuSans.ttf', size)
+        except OSError:
+            font = ImageFont.load_default(size=size)
+        ImageDraw.Draw(img).text((100, 100), text, font=font, fill='black')
+        return img
+
+    texts = ["Solve: 2x + 3 = 7", "Solve: 2x + 8 = 7", "Integrate sin(x) dx"]
+    for size in (12, 20, 28, 48):
+        keys = [make_key(render(text, size), 'prompt') for text in texts]
+        assert len(set(keys)) == len(keys), f"collision at font size {size}"
+        assert make_key(render(texts[0], size), 'prompt') == keys[0], "same image, different key"
+    print(f"ok: {len(texts)} problems get distinct keys at every size; identical images share one")
@@ -0,0 +1,130 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+# --- Vector stroke capture ---
+# st_canvas reports what was drawn twice: as a full RGBA raster (image_data) and as
+# fabric.js objects (json_data). In vector mode we keep only a compact array-backed
+# copy of the objects in session state and rasterize it ourselves when Solve is
+# pressed, at whatever resolution the model needs.
+
+POLYLINE, RECT, ELLIPSE = 0, 1, 2
+TARGET_LONG_EDGE = 768
+MARGIN = 24
+
+
+def _empty():
+    return {
+        'points': np.zeros((0, 2), dtype=np.float32),
+        'offsets': np.zeros(1, dtype=np.int32),
+        'kinds': np.zeros(0, dtype=np.uint8),
+        'widths': np.zeros(0, dtype=np.float32),
+        'erase': np.zeros(0, dtype=bool),
+    }
+
+
+def _path_points(path):
+    pts = []
+    for cmd in path:
+        op, args = cmd[0], cmd[1:]
+        if op in ('M', 'L'):
+            pts.append(args[:2])
+        elif op == 'Q':
+            # midpoint of the quadratic plus its end point is plenty for handwriting
+            cx, cy, x1, y1 = args[:4]
+            x0, y0 = pts[-1] if pts else (x1, y1)
+            pts.append((0.25 * x0 + 0.5 * cx + 0.25 * x1, 0.25 * y0 + 0.5 * cy + 0.25 * y1))
+            pts.append((x1, y1))
+    return np.asarray(pts, dtype=np.float32).reshape(-1, 2)
+
+
+def _object_points(obj):
+    kind = obj.get('type')
+    left, top = float(obj.get('left', 0)), float(obj.get('top', 0))
+    sx, sy = float(obj.get('scaleX', 1)), float(obj.get('scaleY', 1))
+    half = float(obj.get('strokeWidth', 1)) / 2
+    if kind == 'path':
+        pts = _path_points(obj.get('path', []))
+        if len(pts) == 0:
+            return None, None
+        # fabric keeps the raw points and moves the object through left/top
+        pts = (pts - pts.min(axis=0)) * (sx, sy) + (left + half, top + half)
+        return POLYLINE, pts
+    if kind == 'line':
+        cx = left + float(obj.get('width', 0)) * sx / 2
+        cy = top + float(obj.get('height', 0)) * sy / 2
+        pts = np.array([[obj.get('x1', 0), obj.get('y1', 0)], [obj.get('x2', 0), obj.get('y2', 0)]], dtype=np.float32)
+        return POLYLINE, pts * (sx, sy) + (cx, cy)
+    if kind == 'rect':
+        w, h = float(obj.get('width', 0)) * sx, float(obj.get('height', 0)) * sy
+        return RECT, np.array([[left, top], [left + w, top + h]], dtype=np.float32)
+    if kind == 'circle':
+        r = float(obj.get('radius', 0))
+        return ELLIPSE, np.array([[left, top], [left + 2 * r * sx, top + 2 * r * sy]], dtype=np.float32)
+    return None, None
+
+
+def from_json(json_data, bg_color=None):
+    """Flatten fabric.js objects into a few numpy arrays (points, offsets, per-stroke style)."""
+    strokes = _empty()
+    if not json_data:
+        return strokes
+    points, offsets, kinds, widths, erase = [], [0], [], [], []
+    for obj in json_data.get('objects', []):
+        kind, pts = _object_points(obj)
+        if kind is None:
+            continue
+        points.append(pts)
+        offsets.append(offsets[-1] + len(pts))
+        kinds.append(kind)
+        widths.append(float(obj.get('strokeWidth', 1)) * float(obj.get('scaleX', 1)))
+        # the eraser is just a stroke in the background colour
+        erase.append(bg_color is not None and str(obj.get('stroke', '')).lower() == bg_color.lower())
+    if not kinds:
+        return strokes
+    return {
+        'points': np.concatenate(points).astype(np.float32),
+        'offsets': np.asarray(offsets, dtype=np.int32),
+        'kinds': np.asarray(kinds, dtype=np.uint8),
+        'widths': np.asarray(widths, dtype=np.float32),
+        'erase': np.asarray(erase, dtype=bool),
+    }
+
+
+def count(strokes):
+    return len(strokes['kinds'])
+
+
+def nbytes(strokes):
+    return sum(a.nbytes for a in strokes.values())
+
+
+def rasterize(strokes, long_edge=TARGET_LONG_EDGE, margin=MARGIN):
+    """Draw the strokes dark-on-white, cropped to the ink. Returns None if nothing is drawn."""
+    ink = ~strokes['erase']
+    if not ink.any():
+        return None
+    offsets, pts = strokes['offsets'], strokes['points']
+    # crop box from the non-eraser strokes only, padded by their stroke widths
+    ink_pts = np.concatenate([pts[offsets[i]:offsets[i + 1]] for i in np.flatnonzero(ink)])
+    pad = margin + float(strokes['widths'][ink].max())
+    lo = ink_pts.min(axis=0) - pad
+    hi = ink_pts.max(axis=0) + pad
+    scale = min(1.0, long_edge / float((hi - lo).max()))
+    size = np.maximum(np.ceil((hi - lo) * scale), 1).astype(int)
+
+    img = Image.new('L', (int(size[0]), int(size[1])), 255)
+    draw = ImageDraw.Draw(img)
+    for i, kind in enumerate(strokes['kinds']):
+        seg = (pts[offsets[i]:offsets[i + 1]] - lo) * scale
+        width = max(1, int(round(strokes['widths'][i] * scale)))
+        fill = 255 if strokes['erase'][i] else 0
+        xy = [tuple(p) for p in seg.tolist()]
+        if kind == POLYLINE:
+            if len(xy) == 1:
+                xy = xy * 2
+            draw.line(xy, fill=fill, width=width, joint='curve')
+        elif kind == RECT:
+            draw.rectangle(xy, outline=fill, width=width)
+        else:
+            draw.ellipse(xy, outline=fill, width=width)
+    return img
@@ -0,0 +1,235 @@
+import bisect
+import http.server
+import logging
+import os
+import threading
+import time
+
+import jobs
+import ratelimit
+import semantic_cache
+import singleflight
+import solve_cache
+
+# --- Gemini call telemetry ---
+# Every generate_content / send_message goes through gemini.generate / gemini.send,
+# which time it here, tagged by mode (draw, upload, chat, quiz, classifier), model and
+# outcome. Latencies (queue wait and retries included; that is what the user waits
+# for) go into fixed-bucket histograms and usage_metadata into token counters. Like
+# the limiter and the caches whose stats are exported alongside, it is process-wide.
+# render() is the Prometheus text format, served on METRICS_PORT (localhost only by
+# default) and shown on the admin dashboard.
+
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9464))  # 0 disables the endpoint
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)  # seconds
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_calls = {}  # (mode, model, outcome) -> Series
+_tokens = {}  # (mode, model, direction) -> count
+_errors = {}  # (mode, model, exception class) -> count
+_server = None
+
+
+class Series:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other):
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q):
+        """Estimated like Prometheus' histogram_quantile: linear within the bucket."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                if i == len(BUCKETS):
+                    return lower  # beyond the last bound
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+def model_label(model):
+    return (getattr(model, 'model_name', None) or 'unknown').removeprefix('models/')
+
+
+def outcome(error):
+    return 'quota' if isinstance(error, ratelimit.QuotaExceeded) else 'error'
+
+
+def record(mode, model, result, seconds, usage=None, error=None):
+    with _lock:
+        series = _calls.get((mode, model, result))
+        if series is None:
+            series = _calls[(mode, model, result)] = Series()
+        series.add(seconds)
+        if usage is not None:
+            for direction, field in (('input', 'prompt_token_count'), ('output', 'candidates_token_count')):
+                key = (mode, model, direction)
+                _tokens[key] = _tokens.get(key, 0) + (getattr(usage, field, 0) or 0)
+        if error is not None:
+            key = (mode, model, type(error).__name__)
+            _errors[key] = _errors.get(key, 0) + 1
+
+
+def timed(mode, model, call):
+    """call() under the clock; for requests that return a complete response."""
+    start = time.perf_counter()
+    try:
+        response = call()
+    except Exception as e:
+        record(mode, model, outcome(e), time.perf_counter() - start, error=e)
+        raise
+    record(mode, model, 'ok', time.perf_counter() - start, getattr(response, 'usage_metadata', None))
+    return response
+
+
+def streamed(mode, model, call):
+    """Iterate call()'s chunks; recorded once the stream ends, with the usage from its last chunk."""
+    start = time.perf_counter()
+    usage, result, error = None, 'cancelled', None
+    try:
+        for chunk in call():
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+            yield chunk
+        result = 'ok'
+    except Exception as e:
+        result, error = outcome(e), e
+        raise
+    finally:
+        record(mode, model, result, time.perf_counter() - start, usage, error)
+
+
+# --- Views ---
+def summary():
+    """One row per (mode, model) for the dashboard, busiest first."""
+    with _lock:
+        tokens = dict(_tokens)
+        rows = {}
+        for (mode, model, result), series in _calls.items():
+            row = rows.setdefault((mode, model), {'mode': mode, 'model': model, 'calls': 0, 'errors': 0,
+                                                  '_all': Series(), '_ok': Series()})
+            row['calls'] += series.count
+            row['_all'].merge(series)
+            if result == 'ok':
+                row['_ok'].merge(series)
+            elif result != 'cancelled':  # a stream the reader abandoned didn't fail
+                row['errors'] += series.count
+    out = []
+    for (mode, model), row in rows.items():
+        ok = row.pop('_ok')
+        everything = row.pop('_all')
+        row['error rate'] = row['errors'] / row['calls'] if row['calls'] else 0.0
+        row['mean s'] = everything.sum / everything.count if everything.count else 0.0
+        row['p50 s'] = ok.quantile(0.5)
+        row['p95 s'] = ok.quantile(0.95)
+        row['input tokens'] = tokens.get((mode, model, 'input'), 0)
+        row['output tokens'] = tokens.get((mode, model, 'output'), 0)
+        out.append(row)
+    return sorted(out, key=lambda r: -r['calls'])
+
+
+def _labels(**labels):
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(**labels) if labels else ''} {value}")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        calls = sorted((key, list(s.buckets), s.count, s.sum) for key, s in _calls.items())
+        tokens = sorted(_tokens.items())
+        errors = sorted(_errors.items())
+    lines = []
+    name = 'gemini_request_duration_seconds'
+    lines.append(f"# HELP {name} Gemini call latency, including queue wait and retries.")
+    lines.append(f"# TYPE {name} histogram")
+    for (mode, model, result), buckets, count, total in calls:
+        cumulative = 0
+        for bound, n in zip(list(BUCKETS) + ['+Inf'], buckets):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(mode=mode, model=model, outcome=result, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(mode=mode, model=model, outcome=result)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(mode=mode, model=model, outcome=result)} {count}")
+    _metric(lines, 'gemini_tokens_total', 'counter', "Tokens reported by usage_metadata.",
+            [({'mode': m, 'model': model, 'direction': d}, n) for (m, model, d), n in tokens])
+    _metric(lines, 'gemini_errors_total', 'counter', "Failed Gemini calls by exception type.",
+            [({'mode': m, 'model': model, 'error': e}, n) for (m, model, e), n in errors])
+
+    queue = dict(ratelimit.limiter.stats)
+    _metric(lines, 'gemini_queue_requests_total', 'counter', "Requests admitted by the rate limiter.",
+            [({}, queue['requests'])])
+    _metric(lines, 'gemini_queue_delayed_total', 'counter', "Requests that waited in the limiter queue.",
+            [({}, queue['queued'])])
+    _metric(lines, 'gemini_queue_wait_seconds_total', 'counter', "Time spent waiting in the limiter queue.",
+            [({}, f"{queue['queue_seconds']:.6f}")])
+    _metric(lines, 'gemini_queue_events_total', 'counter', "Limiter throttles, retries, refusals and failures.",
+            [({'event': event}, queue[event]) for event in ('throttled', 'retries', 'rejected', 'failures')])
+    _metric(lines, 'gemini_coalesced_total', 'counter', "Single-flight leaders (upstream calls) and followers.",
+            [({'role': 'leader'}, singleflight.stats['leaders']), ({'role': 'follower'}, singleflight.stats['followers'])])
+    _metric(lines, 'cache_requests_total', 'counter', "Solution and question cache lookups by result.",
+            [({'cache': 'solution', 'result': 'hit'}, solve_cache.stats['memory_hits'] + solve_cache.stats['disk_hits']),
+             ({'cache': 'solution', 'result': 'miss'}, solve_cache.stats['misses']),
+             ({'cache': 'question', 'result': 'hit'}, semantic_cache.stats['hits']),
+             ({'cache': 'question', 'result': 'miss'}, semantic_cache.stats['misses'])])
+    _metric(lines, 'jobs_queue_depth', 'gauge', "Background jobs queued or running.", [({}, jobs.queue_depth())])
+    _metric(lines, 'jobs_total', 'counter', "Background jobs by result.",
+            [({'result': r}, jobs.stats[r]) for r in ('submitted', 'done', 'failed', 'refused')])
+    return '\n'.join(lines) + '\n'
+
+
+# --- /metrics endpoint ---
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # a scrape every few seconds would drown the app log
+
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Start the endpoint once per process; returns the port, or None if disabled or the port is taken."""
+    global _server
+    with _lock:
+        if _server is None and port:
+            try:
+                _server = http.server.ThreadingHTTPServer((host, port), _Handler)
+            except OSError as e:
+                log.warning("metrics endpoint not started on %s:%s: %s", host, port, e)
+                _server = False  # don't retry on every rerun
+            else:
+                _server.daemon_threads = True
+                threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+                log.info("metrics on http://%s:%s/metrics", host, port)
+        return _server.server_address[1] if _server else None
@@ -0,0 +1,66 @@
+import sys
+import time
+
+import streamlit as st
+
+# --- Windowed chat transcript ---
+# Only the newest WINDOW messages are rendered on a rerun; older ones sit behind a
+# "load earlier" button. Messages are rendered exactly as they were streamed.
+
+WINDOW = 20
+
+def _load_earlier(window_key, step):
+    st.session_state[window_key] = st.session_state.get(window_key, step) + step
+
+
+def reset(window_key='chat_window'):
+    st.session_state.pop(window_key, None)
+
+
+def render(messages, window_key='chat_window', step=WINDOW):
+    shown = st.session_state.get(window_key, step)
+    hidden = max(len(messages) - shown, 0)
+    if hidden:
+        st.button(f"⬆️ Load {min(step, hidden)} earlier messages ({hidden} hidden)", key=f"{window_key}_more",
+                  on_click=_load_earlier, args=(window_key, step), use_container_width=True)
+    for msg in messages[hidden:]:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+
+
+# --- Benchmark: python main/transcript.py [sizes...] ---
+_BENCH_SCRIPT = """
+import streamlit as st
+import transcript
+messages = [{{"role": "user" if i % 2 == 0 else "assistant",
+              "content": f"Step {{i}}: \\\\( x^{{{{2}}}} + {{i}}x = 0 \\\\) so \\\\[ x = -{{i}} \\\\] " * 8}}
+            for i in range({n})]
+st.sidebar.toggle("sidebar widget")
+if {windowed}:
+    transcript.render(messages)
+else:
+    for msg in messages:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+"""
+
+
+def _bench(n, windowed, reruns=5):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_string(_BENCH_SCRIPT.format(n=n, windowed=windowed), default_timeout=120)
+    at.run()
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    return 1000 * sorted(timings)[len(timings) // 2], len(at.markdown)
+
+
+if __name__ == '__main__':
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 100, 1000]
+    print(f"{'messages':>8} {'full rerun':>12} {'windowed rerun':>15}  (markdown elements full / windowed)")
+    for n in sizes:
+        full_ms, full_elements = _bench(n, False)
+        windowed_ms, windowed_elements = _bench(n, True)
+        print(f"{n:>8} {full_ms:>9.1f} ms {windowed_ms:>12.1f} ms  ({full_elements} / {windowed_elements})")